@@ -1,11 +1,20 @@
 import cv2
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Files only, no GUI backend
 import matplotlib.pyplot as plt
 import sys
 import os
 import json
+import queue
+import threading
 
-def analyze_depth_video(video_path, transition_skip_frames=5):
+def analyze_depth_video(video_path, transition_skip_frames=5, sample_stride=1):
+    # sample_stride > 1 only decodes every Nth frame; skipped frames are
+    # grab()bed so the demuxer advances without running the decoder.
+    # Intra-only codecs (MJPEG) benefit most, but H.264 still skips the
+    # colour conversion and copy-out for every skipped frame.
+    sample_stride = max(1, int(sample_stride))
     cap = cv2.VideoCapture(video_path)
     
     if not cap.isOpened():
@@ -16,59 +25,113 @@ def analyze_depth_video(video_path, transition_skip_frames=5):
     if fps == 0:
         fps = 23.976
     
-    frame_numbers = []
-    max_depths = []
-    min_depths = []
-    
-    frame_idx = 0
+    # Size the result arrays from the container frame count; it is only an
+    # estimate (0 when unknown), so the arrays grow if more frames decode
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    num_samples = max(1, (total_frames + sample_stride - 1) // sample_stride)
+    max_depths = np.empty(num_samples, dtype=np.uint8)
+    min_depths = np.empty(num_samples, dtype=np.uint8)
+    
+    # Decode on a reader thread so the demuxer/decoder overlaps with the
+    # reduction below; the bounded queue provides back-pressure.
+    read_q = queue.Queue(maxsize=8)
+    decoded = [0]
+    reader_error = [None]  # Exception raised on the reader thread, re-raised after join
+    # retrieve() decodes into recycled buffers instead of allocating a frame
+    # each call. A buffer is only rewritten once the queue (maxsize), the
+    # frame being reduced and the one being decoded have all moved past it.
+    frame_pool = [None] * (read_q.maxsize + 2)
+    
+    def reader():
+        frame_idx = 0
+        pool_idx = 0
+        try:
+            while True:
+                if not cap.grab():
+                    break
+                
+                if frame_idx % sample_stride == 0:
+                    ret, frame = cap.retrieve(frame_pool[pool_idx])
+                    if not ret:
+                        break
+                    frame_pool[pool_idx] = frame
+                    pool_idx = (pool_idx + 1) % len(frame_pool)
+                    read_q.put(frame)
+                
+                frame_idx += 1
+        except Exception as e:
+            reader_error[0] = e
+        finally:
+            # Always end the stream, or the loop below waits on get() forever
+            decoded[0] = frame_idx
+            read_q.put(None)
+    
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+    
+    sample_idx = 0
+    gray = None
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        frame = read_q.get()
+        if frame is None:
             break
         
         if len(frame.shape) == 3:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Depth videos are grayscale, so every channel carries the same
+            # value; copying one out is cheaper than a weighted cvtColor
+            gray = cv2.extractChannel(frame, 0, dst=gray)
         else:
             gray = frame
         
-        max_depth = np.max(gray)
-        min_depth = np.min(gray)
+        # Single pass over the frame for both extremes
+        min_depth, max_depth, _, _ = cv2.minMaxLoc(gray)
         
-        frame_numbers.append(frame_idx)
-        max_depths.append(max_depth)
-        min_depths.append(min_depth)
+        if sample_idx == len(max_depths):
+            max_depths = np.concatenate([max_depths, np.empty_like(max_depths)])
+            min_depths = np.concatenate([min_depths, np.empty_like(min_depths)])
         
-        frame_idx += 1
+        max_depths[sample_idx] = max_depth
+        min_depths[sample_idx] = min_depth
+        sample_idx += 1
         
-        if frame_idx % 100 == 0:
-            print(f"Processed {frame_idx} frames...")
+        if sample_idx % 500 == 0:
+            print(f"Processed {sample_idx * sample_stride} frames...")
     
+    reader_thread.join()
     cap.release()
-    
-    print(f"Total frames processed: {len(frame_numbers)}")
-    
-    plt.figure(figsize=(12, 6))
-    plt.plot(frame_numbers, max_depths, 'b-', linewidth=1.5, label='Max Depth', alpha=0.7)
-    plt.plot(frame_numbers, min_depths, 'r-', linewidth=1.5, label='Min Depth', alpha=0.7)
-    plt.xlabel('Frame Number')
-    plt.ylabel('Depth Value (0-255)')
-    plt.title('Min and Max Depth Values Per Frame')
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.ylim(0, 255)
+    if reader_error[0] is not None:
+        raise reader_error[0]
+    frame_idx = decoded[0]
+    
+    # Trim to the frames actually decoded
+    max_depths = max_depths[:sample_idx]
+    min_depths = min_depths[:sample_idx]
+    frame_numbers = np.arange(sample_idx) * sample_stride
+    
+    print(f"Total frames processed: {len(frame_numbers)} (of {frame_idx} decoded, stride {sample_stride})")
+    
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(frame_numbers, max_depths, 'b-', linewidth=1.5, label='Max Depth', alpha=0.7)
+    ax.plot(frame_numbers, min_depths, 'r-', linewidth=1.5, label='Min Depth', alpha=0.7)
+    ax.set_xlabel('Frame Number')
+    ax.set_ylabel('Depth Value (0-255)')
+    ax.set_title('Min and Max Depth Values Per Frame')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    ax.set_ylim(0, 255)
     
     output_path = os.path.join(os.path.dirname(video_path), 'depth_stats.png')
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
+    fig.savefig(output_path, dpi=100)
     print(f"Graph saved to: {output_path}")
     
-    plt.close()
-    
     metadata_path = os.path.join(os.path.dirname(video_path), 'metadata.json')
     if os.path.exists(metadata_path):
         print(f"Found metadata.json, analyzing per-scene depth...")
-        analyze_per_scene_depth(video_path, metadata_path, max_depths, min_depths, fps, transition_skip_frames)
+        analyze_per_scene_depth(video_path, metadata_path, max_depths, min_depths, fps, transition_skip_frames, sample_stride, fig=fig)
+    
+    plt.close(fig)
 
-def analyze_per_scene_depth(video_path, metadata_path, max_depths, min_depths, fps, transition_skip_frames=5):
+def analyze_per_scene_depth(video_path, metadata_path, max_depths, min_depths, fps, transition_skip_frames=5, sample_stride=1, fig=None):
     with open(metadata_path, 'r') as f:
         metadata = json.load(f)
     
@@ -79,11 +142,14 @@ def analyze_per_scene_depth(video_path, metadata_path, max_depths, min_depths, f
     scene_timestamps = metadata['scene_timestamps']
     video_fps = metadata.get('fps', fps)
     
+    max_depths = np.asarray(max_depths, dtype=np.uint8)
+    min_depths = np.asarray(min_depths, dtype=np.uint8)
+    
     scene_numbers = []
-    scene_max_depths = []
-    scene_min_depths = []
+    sample_starts = []
+    sample_ends = []
     
-    total_frames = len(max_depths)
+    total_frames = len(max_depths) * sample_stride
     
     for scene_idx in range(len(scene_timestamps) - 1):
         start_time = scene_timestamps[scene_idx]
@@ -105,38 +171,54 @@ def analyze_per_scene_depth(video_path, metadata_path, max_depths, min_depths, f
             scene_start = start_frame
             scene_end = end_frame
         
-        scene_max_values = max_depths[scene_start:scene_end]
-        scene_min_values = min_depths[scene_start:scene_end]
+        # Map frame numbers onto the sampled arrays (ceil keeps the bounds
+        # inside the scene)
+        sample_start = -(-scene_start // sample_stride)
+        sample_end = min(-(-scene_end // sample_stride), len(max_depths))
         
-        if len(scene_max_values) > 0:
-            scene_max_depth = np.max(scene_max_values)
-            scene_min_depth = np.min(scene_min_values)
-            
+        if sample_end > sample_start:
             scene_numbers.append(scene_idx)
-            scene_max_depths.append(scene_max_depth)
-            scene_min_depths.append(scene_min_depth)
+            sample_starts.append(sample_start)
+            sample_ends.append(sample_end)
     
     if len(scene_numbers) == 0:
         print("No valid scenes found for analysis")
         return
     
-    plt.figure(figsize=(12, 6))
-    plt.plot(scene_numbers, scene_max_depths, 'b-', linewidth=1.5, marker='o', markersize=4, label='Max Depth', alpha=0.7)
-    plt.plot(scene_numbers, scene_min_depths, 'r-', linewidth=1.5, marker='o', markersize=4, label='Min Depth', alpha=0.7)
-    plt.xlabel('Scene Number')
-    plt.ylabel('Depth Value (0-255)')
-    plt.title(f'Min and Max Depth Values Per Scene (skipping {transition_skip_frames} frames at transitions)')
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.ylim(0, 255)
+    # Reduce all scenes in one call: reduceat over interleaved
+    # [start, end) boundaries, keeping only the in-scene segments. A
+    # trailing pad element makes an end equal to the array length valid.
+    boundaries = np.empty(2 * len(scene_numbers), dtype=np.intp)
+    boundaries[0::2] = sample_starts
+    boundaries[1::2] = sample_ends
+    scene_max_depths = np.maximum.reduceat(np.append(max_depths, 0), boundaries)[0::2]
+    scene_min_depths = np.minimum.reduceat(np.append(min_depths, 0), boundaries)[0::2]
+    
+    # Reuse the caller's figure when given instead of allocating a new one
+    owns_fig = fig is None
+    if owns_fig:
+        fig = plt.figure(figsize=(12, 6))
+    else:
+        fig.clear()
+    ax = fig.add_subplot()
+    ax.plot(scene_numbers, scene_max_depths, 'b-', linewidth=1.5, marker='o', markersize=4, label='Max Depth', alpha=0.7)
+    ax.plot(scene_numbers, scene_min_depths, 'r-', linewidth=1.5, marker='o', markersize=4, label='Min Depth', alpha=0.7)
+    ax.set_xlabel('Scene Number')
+    ax.set_ylabel('Depth Value (0-255)')
+    ax.set_title(f'Min and Max Depth Values Per Scene (skipping {transition_skip_frames} frames at transitions)')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    ax.set_ylim(0, 255)
     
     output_path = os.path.join(os.path.dirname(video_path), 'depth_stats_per_scene.png')
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
+    fig.savefig(output_path, dpi=100)
     print(f"Per-scene graph saved to: {output_path}")
     
-    plt.close()
+    if owns_fig:
+        plt.close(fig)
 
 if __name__ == "__main__":
     video_path = sys.argv[1] if len(sys.argv) > 1 else "/home/al/VDA_inpainting/outputs/yesterday_clip-1764103445/depth.mp4"
-    analyze_depth_video(video_path)
+    sample_stride = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    analyze_depth_video(video_path, sample_stride=sample_stride)
 
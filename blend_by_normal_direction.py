@@ -21,53 +21,58 @@ def blend_by_normal_direction(original_path, normal_path, output_path, strength=
                  > 1.0: More areas use normal map (stronger effect)
                  < 1.0: Fewer areas use normal map (weaker effect)
     """
-    # Load images
-    original = Image.open(original_path).convert('RGB')
-    normal_map = Image.open(normal_path).convert('RGB')
+    # Load images (convert only when needed; RGB files are used as-is)
+    original = Image.open(original_path)
+    if original.mode != 'RGB':
+        original = original.convert('RGB')
+    normal_map = Image.open(normal_path)
+    if normal_map.mode != 'RGB':
+        normal_map = normal_map.convert('RGB')
     
     # Ensure same size
     if original.size != normal_map.size:
         print(f"Warning: Images have different sizes. Resizing normal map to match original")
         normal_map = normal_map.resize(original.size, Image.Resampling.LANCZOS)
     
-    # Convert to numpy arrays
-    orig_arr = np.array(original, dtype=np.float32)
-    normal_arr = np.array(normal_map, dtype=np.float32)
+    # View as uint8 arrays (no float copies)
+    orig_arr = np.asarray(original)
+    normal_arr = np.asarray(normal_map)
     
     # Extract Z component from normal map (blue channel)
     # Normal maps typically encode normals where:
     # - R = X component (mapped from -1 to 1, stored as 0-255)
     # - G = Y component (mapped from -1 to 1, stored as 0-255)
     # - B = Z component (mapped from -1 to 1, stored as 0-255)
-    z_component = normal_arr[:, :, 2]  # Blue channel
+    # The Z component is sliced as normal_arr[:, :, 2:3] to keep the channel axis
     
-    # Normalize Z component from [0, 255] to [0, 1]
-    # High Z (close to 255) = facing camera
-    # Low Z (close to 0) = perpendicular/away from camera
-    z_normalized = z_component / 255.0
-    
-    # Create blend factor:
+    # Create blend factor from the normalized Z component:
     # - High Z (facing camera) → blend_factor → 1.0 → use original image
     # - Low Z (perpendicular) → blend_factor → 0.0 → use normal map
-    blend_factor = z_normalized
-    
+    #
     # Apply strength factor to control effect intensity
-    # Using power function: strength > 1 makes more areas use normal map
-    # strength < 1 makes fewer areas use normal map
-    if strength != 1.0:
-        # Invert and apply power: blend_factor^(1/strength)
-        # When strength > 1, this reduces blend_factor values, making more normal map visible
-        # When strength < 1, this increases blend_factor values, making more original visible
-        blend_factor = np.power(blend_factor, 1.0 / strength)
-    
-    # Expand blend_factor to 3 channels for broadcasting
-    blend_factor_3d = np.stack([blend_factor, blend_factor, blend_factor], axis=2)
+    # Using power function: blend_factor^(1/strength)
+    # When strength > 1, this reduces blend_factor values, making more normal map visible
+    # When strength < 1, this increases blend_factor values, making more original visible
+    #
+    # Weights are integers in [0, 255] with a trailing channel axis so they
+    # broadcast over RGB.
+    if strength == 1.0:
+        # Identity curve: the blue channel already is the weight
+        weight = normal_arr[:, :, 2:3]
+    else:
+        # Z only takes 256 values, so evaluate the curve once per value
+        levels = np.arange(256, dtype=np.float64) / 255.0
+        lut = np.rint(np.power(levels, 1.0 / strength) * 255.0).astype(np.uint16)
+        weight = lut[normal_arr[:, :, 2:3]]
     
     # Blend: original * blend_factor + normal_map * (1 - blend_factor)
-    blended = orig_arr * blend_factor_3d + normal_arr * (1.0 - blend_factor_3d)
-    
-    # Clip to valid range and convert back to uint8
-    blended = np.clip(blended, 0, 255).astype(np.uint8)
+    # in uint16 fixed point: 255 * 255 + 127 still fits in 16 bits, and the
+    # result is already in [0, 255] so no clip is needed.
+    blended = np.multiply(orig_arr, weight, dtype=np.uint16)
+    blended += np.multiply(normal_arr, 255 - weight, dtype=np.uint16)
+    blended += 127
+    blended //= 255
+    blended = blended.astype(np.uint8)
     
     # Create PIL Image and save
     result = Image.fromarray(blended)
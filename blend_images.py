@@ -3,6 +3,7 @@
 Script to blend two images with specified weights
 """
 import sys
+import cv2
 from PIL import Image
 import numpy as np
 from pathlib import Path
@@ -19,23 +20,16 @@ def blend_images(img1_path, img2_path, output_path, weight1=0.5, weight2=0.5):
         weight2: Weight for second image (default 0.5)
     """
     # Load images
-    img1 = Image.open(img1_path).convert('RGB')
-    img2 = Image.open(img2_path).convert('RGB')
+    arr1 = np.asarray(Image.open(img1_path).convert('RGB'))
+    arr2 = np.asarray(Image.open(img2_path).convert('RGB'))
     
     # Ensure same size
-    if img1.size != img2.size:
+    if arr1.shape != arr2.shape:
         print(f"Warning: Images have different sizes. Resizing {img2_path} to match {img1_path}")
-        img2 = img2.resize(img1.size, Image.Resampling.LANCZOS)
+        arr2 = cv2.resize(arr2, (arr1.shape[1], arr1.shape[0]), interpolation=cv2.INTER_LANCZOS4)
     
-    # Convert to numpy arrays
-    arr1 = np.array(img1, dtype=np.float32)
-    arr2 = np.array(img2, dtype=np.float32)
-    
-    # Blend
-    blended = weight1 * arr1 + weight2 * arr2
-    
-    # Clip to valid range and convert back to uint8
-    blended = np.clip(blended, 0, 255).astype(np.uint8)
+    # Blend on uint8 directly; addWeighted saturates to [0, 255] itself
+    blended = cv2.addWeighted(arr1, weight1, arr2, weight2, 0.0)
     
     # Create PIL Image and save
     result = Image.fromarray(blended)
@@ -6,8 +6,12 @@ Concatenates:
 - depth: (total_frames, height, width) - metric depth values
 - conf: (total_frames, height, width) - confidence values (if available)
 
+The archive is written uncompressed by default: zlib in savez_compressed is
+single-threaded and dominates wall time for multi-GB depth stacks, and stored
+members can be memory-mapped by readers. Pass --compress for a smaller file.
+
 Usage:
-    python create_depth_npz.py <output_dir>
+    python create_depth_npz.py <output_dir> [--compress]
     
 Example:
     python create_depth_npz.py outputs/yesterday_clip-1764868582
@@ -16,10 +20,57 @@ Example:
 import json
 import numpy as np
 from pathlib import Path
+import subprocess
 import sys
 
 
-def create_depth_npz(output_dir: Path):
+def _npz_array_shape(npz, key):
+    """Read the shape of an array stored in an open npz without loading it."""
+    with npz.zip.open(f"{key}.npy") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, _ = np.lib.format.read_array_header_2_0(f)
+    return shape
+
+
+def _video_frame_count(video_path: Path) -> int:
+    """
+    Frame count of a video from its container header.
+    
+    Uses nb_frames, then duration * frame rate; only decodes the whole
+    stream (-count_frames) when the header has neither.
+    """
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=nb_frames,duration,r_frame_rate',
+         '-of', 'json', str(video_path)],
+        capture_output=True, text=True
+    )
+    streams = json.loads(result.stdout or '{}').get('streams', [])
+    if streams:
+        stream = streams[0]
+        nb_frames = stream.get('nb_frames', 'N/A')
+        if nb_frames not in ('N/A', '0'):
+            return int(nb_frames)
+        
+        duration = stream.get('duration', 'N/A')
+        rate = stream.get('r_frame_rate', '0/1')
+        num, _, den = rate.partition('/')
+        if duration != 'N/A' and float(den or 1) > 0 and float(num) > 0:
+            return int(round(float(duration) * float(num) / float(den or 1)))
+    
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-count_frames', '-show_entries', 'stream=nb_read_frames',
+         '-of', 'default=noprint_wrappers=1:nokey=1', str(video_path)],
+        capture_output=True, text=True
+    )
+    return int(result.stdout.strip())
+
+
+def create_depth_npz(output_dir: Path, compress: bool = False):
     """Create top-level depth.npz from scene npz files."""
     metadata_file = output_dir / "metadata.json"
     scenes_dir = output_dir / "scenes"
@@ -44,8 +95,13 @@ def create_depth_npz(output_dir: Path):
     
     print(f"Concatenating depth from {scene_count} scenes...")
     
-    all_depths = []
-    all_confs = []
+    # First pass: collect per-scene sources and frame counts. npz scenes
+    # only have their array headers read here so the data is loaded once,
+    # straight into the combined buffer below; flat scenes are just a frame
+    # count and a fill value.
+    scene_entries = []  # ('npz', scene number, num frames, path) | ('flat', scene number, num frames, value)
+    depth_shapes = []
+    all_have_conf = True
     total_frames = 0
     
     for i in range(1, scene_count + 1):
@@ -68,27 +124,11 @@ def create_depth_npz(output_dir: Path):
             # Flat depth scene - check for depth.mp4 to get frame count
             depth_video = scene_dir / "depth.mp4"
             if depth_video.exists():
-                import subprocess
-                result = subprocess.run(
-                    ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
-                     '-count_frames', '-show_entries', 'stream=nb_read_frames',
-                     '-of', 'default=noprint_wrappers=1:nokey=1', str(depth_video)],
-                    capture_output=True, text=True
-                )
                 try:
-                    num_frames = int(result.stdout.strip())
-                    # Get dimensions from first valid scene
-                    if all_depths and len(all_depths) > 0:
-                        h, w = all_depths[0].shape[1], all_depths[0].shape[2]
-                    else:
-                        # Default dimensions - will be overwritten if we find a valid scene later
-                        h, w = 308, 728
-                    
-                    # Create flat depth array with value 100 (normalized)
-                    flat_depth = np.full((num_frames, h, w), 100.0, dtype=np.float32)
-                    flat_conf = np.ones((num_frames, h, w), dtype=np.float32)
-                    all_depths.append(flat_depth)
-                    all_confs.append(flat_conf)
+                    num_frames = _video_frame_count(depth_video)
+                    # Flat depth with value 100 (normalized); dimensions come
+                    # from the npz scenes and it is filled in place below
+                    scene_entries.append(('flat', i, num_frames, 100.0))
                     total_frames += num_frames
                     print(f"  Scene {i}: {num_frames} frames (flat depth)")
                     continue
@@ -98,33 +138,54 @@ def create_depth_npz(output_dir: Path):
             continue
         
         try:
-            data = np.load(npz_path)
-            depth = data['depth']  # (frames, height, width)
-            
-            all_depths.append(depth)
-            total_frames += depth.shape[0]
-            
-            if 'conf' in data:
-                all_confs.append(data['conf'])
+            with np.load(npz_path) as data:
+                depth_shape = _npz_array_shape(data, 'depth')  # (frames, height, width)
+                has_conf = 'conf' in data.files
             
-            print(f"  Scene {i}: {depth.shape[0]} frames, range=[{depth.min():.2f}, {depth.max():.2f}]m")
+            scene_entries.append(('npz', i, depth_shape[0], npz_path))
+            depth_shapes.append(depth_shape)
+            total_frames += depth_shape[0]
+            all_have_conf = all_have_conf and has_conf
             
         except Exception as e:
             print(f"  Scene {i}: error reading npz: {e}")
             continue
     
-    if not all_depths:
+    if not scene_entries:
         print("Error: No depth data found in any scene")
         return False
     
-    # Concatenate all arrays
-    print(f"\nConcatenating {len(all_depths)} scene arrays...")
-    combined_depth = np.concatenate(all_depths, axis=0)
+    # Second pass: copy every scene into one preallocated buffer instead of
+    # holding a list of arrays plus their concatenation
+    print(f"\nConcatenating {len(scene_entries)} scene arrays...")
+    if depth_shapes:
+        h, w = depth_shapes[0][1], depth_shapes[0][2]
+    else:
+        # Only flat scenes - default dimensions
+        h, w = 308, 728
+    combined_depth = np.empty((total_frames, h, w), dtype=np.float32)
+    combined_conf = np.empty((total_frames, h, w), dtype=np.float32) if all_have_conf else None
+    
+    offset = 0
+    for kind, i, num_frames, source in scene_entries:
+        dest = slice(offset, offset + num_frames)
+        if kind == 'flat':
+            combined_depth[dest].fill(source)
+            if combined_conf is not None:
+                combined_conf[dest].fill(1.0)
+        else:
+            with np.load(source) as data:
+                depth = data['depth']
+                np.copyto(combined_depth[dest], depth)
+                if combined_conf is not None:
+                    np.copyto(combined_conf[dest], data['conf'])
+            print(f"  Scene {i}: {num_frames} frames, range=[{depth.min():.2f}, {depth.max():.2f}]m")
+            del depth
+        offset += num_frames
     
     save_dict = {'depth': combined_depth}
     
-    if all_confs and len(all_confs) == len(all_depths):
-        combined_conf = np.concatenate(all_confs, axis=0)
+    if combined_conf is not None:
         save_dict['conf'] = combined_conf
     
     print(f"Combined depth shape: {combined_depth.shape}")
@@ -133,7 +194,10 @@ def create_depth_npz(output_dir: Path):
     
     # Save
     print(f"\nSaving to {output_npz}...")
-    np.savez_compressed(output_npz, **save_dict)
+    if compress:
+        np.savez_compressed(output_npz, **save_dict)
+    else:
+        np.savez(output_npz, **save_dict)
     
     # Report file size
     size_mb = output_npz.stat().st_size / (1024 * 1024)
@@ -148,11 +212,12 @@ def main():
         sys.exit(1)
     
     output_dir = Path(sys.argv[1])
+    compress = '--compress' in sys.argv[2:]
     if not output_dir.exists():
         print(f"Error: Directory not found: {output_dir}")
         sys.exit(1)
     
-    success = create_depth_npz(output_dir)
+    success = create_depth_npz(output_dir, compress=compress)
     sys.exit(0 if success else 1)
 
 
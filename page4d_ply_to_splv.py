@@ -1,5 +1,6 @@
 import glob
 import os
+from concurrent.futures import ThreadPoolExecutor
 from spatialstudio import splv
 import plyfile
 import numpy as np
@@ -10,23 +11,33 @@ output_path = "/home/al/VDA_inpainting/page4doutput/riverside/splv/page4d_output
 os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
 
-def get_world_bounds(ply_file_list):
-    all_vertices = []
-    for ply_file in ply_file_list:
-        ply = plyfile.PlyData.read(ply_file)
-        vertex_data = ply.elements[0].data
-        vertices = np.column_stack([vertex_data['x'], vertex_data['y'], vertex_data['z']])
-        all_vertices.append(vertices)
+VERTEX_FIELDS = ('x', 'y', 'z', 'red', 'green', 'blue')
+
+
+def _read_ply(ply_file):
+    ply = plyfile.PlyData.read(ply_file)
+    vertex_data = ply.elements[0].data
+    # Keep only the fields the encoder needs so the cache stays small
+    vertex_arrays = {name: np.ascontiguousarray(vertex_data[name]) for name in VERTEX_FIELDS}
+    vertices = np.column_stack([vertex_arrays['x'], vertex_arrays['y'], vertex_arrays['z']])
+    return vertices.min(axis=0), vertices.max(axis=0), vertex_arrays
+
+
+def get_world_bounds(ply_file_list, max_workers=8):
+    # Reduce each file to its own min/max so the vertices never have to be
+    # stacked together; file reads overlap across threads. The parsed vertex
+    # arrays are returned too so the encoding pass doesn't read the files again.
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        per_file = list(pool.map(_read_ply, ply_file_list))
     
-    all_vertices = np.vstack(all_vertices)
-    min_bounds = np.min(all_vertices, axis=0)
-    max_bounds = np.max(all_vertices, axis=0)
-    return min_bounds, max_bounds
+    min_bounds = np.minimum.reduce([mins for mins, _, _ in per_file])
+    max_bounds = np.maximum.reduce([maxs for _, maxs, _ in per_file])
+    per_file_arrays = [arrays for _, _, arrays in per_file]
+    return min_bounds, max_bounds, per_file_arrays
 
 
 ply_files = glob.glob(os.path.join(input_path, "*.ply"))
-breakpoint()
-min_bounds, max_bounds = get_world_bounds(ply_files)
+min_bounds, max_bounds, per_file_arrays = get_world_bounds(ply_files)
 print(min_bounds, max_bounds)
 
 splv_width = 400
@@ -48,17 +59,25 @@ z_offset = min_bounds[2]
 encoder = splv.Encoder(width=splv_width, height=splv_height, depth=splv_depth, framerate=splv_framerate, outputPath=output_path)
 
 
-for ply_file in ply_files:
+for vertex_data in per_file_arrays:
     frame = splv.Frame(splv_width, splv_height, splv_depth)
-    ply = plyfile.PlyData.read(ply_file)
-    vertex_data = ply.elements[0].data
-    for i in range(len(vertex_data)):
-        r, g, b = vertex_data['red'][i], vertex_data['green'][i], vertex_data['blue'][i]
-        x, y, z = vertex_data['x'][i], vertex_data['y'][i], vertex_data['z'][i]
-        x = int((x - x_offset) / x_scale)
-        y = int((y - y_offset) / y_scale)
-        z = int((z - z_offset) / z_scale)
-        frame[x, splv_height - 1 - y, z] = (r, g, b)
+    # Quantize all vertices at once; int32 truncation matches int() for the
+    # non-negative offsets produced by the world bounds
+    xs = ((vertex_data['x'] - x_offset) / x_scale).astype(np.int32)
+    ys = (splv_height - 1) - ((vertex_data['y'] - y_offset) / y_scale).astype(np.int32)
+    zs = ((vertex_data['z'] - z_offset) / z_scale).astype(np.int32)
+    # Keep only the last vertex per voxel (same result as overwriting in order)
+    voxel_ids = (xs.astype(np.int64) * splv_height + ys) * splv_depth + zs
+    _, last = np.unique(voxel_ids[::-1], return_index=True)
+    keep = len(voxel_ids) - 1 - last
+    # splv.Frame only exposes per-voxel assignment, so feed it plain Python
+    # ints instead of indexing the structured array per vertex
+    voxels = zip(xs[keep].tolist(), ys[keep].tolist(), zs[keep].tolist(),
+                 vertex_data['red'][keep].tolist(),
+                 vertex_data['green'][keep].tolist(),
+                 vertex_data['blue'][keep].tolist())
+    for x, y, z, r, g, b in voxels:
+        frame[x, y, z] = (r, g, b)
     encoder.encode(frame)
 
 encoder.finish()
@@ -6,19 +6,265 @@ Also updates metadata.json with postprocessing info and creates export.zip.
 """
 
 import argparse
+import functools
 import json
+import math
 import numpy as np
 from pathlib import Path
 import subprocess
 import tempfile
 import zipfile
 import os
-from scipy import ndimage
+import queue
+import shutil
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import cv2
+
+try:
+    import numba
+except ImportError:  # Optional: NumPy fallback below
+    numba = None
 
 # Constants
 DEFAULT_BLUR_SIGMA = 7.0  # Gaussian blur sigma in pixels
 LOG_BASE = 10.0  # Natural logarithm base (e)
 SHARPEN = 0.4
+GAUSSIAN_TRUNCATE = 4.0  # Kernel radius in sigmas (matches scipy.ndimage default)
+BLUR_CHUNK_FRAMES = 8  # Frames per thread-pool task
+NPZ_EXTRACT_CHUNK_BYTES = 16 * 1024 * 1024  # Copy size when extracting compressed npz members
+VIDEO_ENCODERS = ('auto', 'libx264', 'h264_nvenc', 'hevc_nvenc')
+
+
+@functools.lru_cache(maxsize=None)
+def _encoder_usable(encoder: str) -> bool:
+    """Check that ffmpeg can actually open an encoder (NVENC also needs a GPU and driver)."""
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-v', 'error',
+         '-f', 'lavfi', '-i', 'color=c=black:s=256x256:d=0.1',
+         '-c:v', encoder, '-pix_fmt', 'yuv420p', '-f', 'null', '-'],
+        capture_output=True
+    )
+    return result.returncode == 0
+
+
+def _pick_encoder(encoder: str = 'auto') -> str:
+    """Resolve the depth video encoder, falling back to libx264 when NVENC fails to initialize."""
+    if encoder == 'libx264':
+        return encoder
+    candidate = 'h264_nvenc' if encoder == 'auto' else encoder
+    if _encoder_usable(candidate):
+        return candidate
+    if encoder != 'auto':
+        print(f"Warning: {encoder} is not available, falling back to libx264")
+    return 'libx264'
+
+
+def _encoder_args(encoder: str) -> list:
+    """ffmpeg output codec arguments for the depth video."""
+    if encoder.endswith('_nvenc'):
+        return ['-c:v', encoder, '-preset', 'p5', '-tune', 'hq',
+                '-rc', 'vbr', '-cq', '19', '-b:v', '0', '-pix_fmt', 'yuv420p']
+    return ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '18']
+
+
+def gaussian_kernel_1d(sigma: float) -> np.ndarray:
+    """1-D float32 Gaussian kernel with the same extent as scipy.ndimage (truncate=4)."""
+    radius = int(GAUSSIAN_TRUNCATE * sigma + 0.5)
+    return cv2.getGaussianKernel(2 * radius + 1, sigma, cv2.CV_32F)
+
+
+def gaussian_blur_frames(frames: np.ndarray, kernel: np.ndarray, dst: np.ndarray,
+                         scratch: np.ndarray = None) -> None:
+    """
+    Separable Gaussian blur of a (N, H, W) float32 block into dst.
+    
+    The horizontal pass never crosses rows, so it runs over all N*H rows of
+    the block in a single cv2 call; the vertical pass runs per frame so the
+    reflect border stays at each frame's edges. A kernel of None copies.
+    scratch, if given, is a float32 buffer of at least N frames used for the
+    intermediate pass.
+    """
+    if kernel is None:
+        np.copyto(dst, frames)
+        return
+    num, height, width = frames.shape
+    identity = np.ones((1, 1), dtype=np.float32)
+    rows = scratch[:num] if scratch is not None else np.empty((num, height, width), dtype=np.float32)
+    cv2.sepFilter2D(
+        frames.reshape(num * height, width), cv2.CV_32F, kernel, identity,
+        dst=rows.reshape(num * height, width), borderType=cv2.BORDER_REFLECT
+    )
+    for i in range(num):
+        cv2.sepFilter2D(
+            rows[i], cv2.CV_32F, identity, kernel,
+            dst=dst[i], borderType=cv2.BORDER_REFLECT
+        )
+
+
+if numba is not None:
+    @numba.njit(nogil=True, fastmath=True, cache=True)
+    def _log_sharpen_kernel(out, frames, blurred_weight, original_weight, frame_min, frame_max):
+        """
+        out = blurred_weight * log1p(out) + original_weight * log1p(frames), in one
+        pass, recording each frame's min and max of the result on the way.
+        """
+        num, height, width = out.shape
+        for i in range(num):
+            lo = np.inf
+            hi = -np.inf
+            for j in range(height):
+                for k in range(width):
+                    value = blurred_weight * math.log1p(out[i, j, k])
+                    if original_weight != 0.0:
+                        value += original_weight * math.log1p(frames[i, j, k])
+                    out[i, j, k] = value
+                    lo = min(lo, value)
+                    hi = max(hi, value)
+            frame_min[i] = lo
+            frame_max[i] = hi
+else:
+    _log_sharpen_kernel = None
+
+
+def process_depth_frames(
+    frames: np.ndarray,
+    kernel: np.ndarray,
+    blurred_weight: float,
+    original_weight: float,
+    out: np.ndarray,
+    scratch: np.ndarray = None,
+    frame_min: np.ndarray = None,
+    frame_max: np.ndarray = None,
+) -> None:
+    """
+    Blur, log and sharpen a (N, H, W) float32 block into out.
+    
+    out = original_weight * ln(frames + 1) + blurred_weight * ln(blur(frames) + 1)
+    The whole block is finished while it is still in cache. scratch, if
+    given, is a reusable float32 buffer of at least N frames so no
+    temporaries are allocated per block. frame_min/frame_max, if given, are
+    length-N float32 arrays that receive each output frame's extrema.
+    """
+    if scratch is None:
+        scratch = np.empty(frames.shape, dtype=np.float32)
+    if frame_min is None:
+        frame_min = np.empty(len(frames), dtype=np.float32)
+    if frame_max is None:
+        frame_max = np.empty(len(frames), dtype=np.float32)
+    
+    if kernel is None:
+        # No blur: both terms are ln(frames + 1), so take the log once with
+        # the weights combined
+        blurred_weight = np.float32(blurred_weight + original_weight)
+        original_weight = np.float32(0.0)
+    
+    # Apply Gaussian blur
+    gaussian_blur_frames(frames, kernel, out, scratch)
+    
+    if _log_sharpen_kernel is not None:
+        # Fused log + sharpen + extrema: one read of each input and one write
+        _log_sharpen_kernel(out, frames, blurred_weight, original_weight, frame_min, frame_max)
+        return
+    
+    # Apply ln(x+1) via log1p; the log base is part of the weights
+    np.log1p(out, out=out)
+    if blurred_weight != 1.0:
+        out *= blurred_weight
+    
+    # Sharpen by blending in the logged original (pre-blur) depth
+    if original_weight != 0.0:
+        original_logged = np.log1p(frames, out=scratch[:len(frames)])
+        original_logged *= original_weight
+        out += original_logged
+    
+    flat = out.reshape(len(out), -1)
+    np.min(flat, axis=1, out=frame_min)
+    np.max(flat, axis=1, out=frame_max)
+
+
+def load_npz_array(npz_path: Path, key: str) -> np.ndarray:
+    """
+    Load one array from an npz, memory-mapping it when possible.
+    
+    np.load ignores mmap_mode for npz archives, so stored (uncompressed)
+    members are mapped directly from their offset inside the zip; the OS
+    then pages frames in on demand. Compressed members are mapped from a
+    temporary extract next to the archive, falling back to a regular load.
+    create_depth_npz.py writes uncompressed by default.
+    """
+    with zipfile.ZipFile(npz_path) as zf:
+        member = f"{key}.npy"
+        if member not in zf.namelist():
+            available = [name[:-4] if name.endswith('.npy') else name for name in zf.namelist()]
+            raise ValueError(f"No '{key}' key found in {npz_path}. Available keys: {available}")
+        info = zf.getinfo(member)
+    
+    if info.compress_type == zipfile.ZIP_STORED:
+        with open(npz_path, 'rb') as f:
+            # Local file header: 30 fixed bytes, then name and extra field
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            data_offset = f.tell()
+        if not dtype.hasobject:
+            print(f"Memory-mapping '{key}' from {npz_path}")
+            return np.memmap(npz_path, dtype=dtype, mode='r', shape=shape,
+                             order='F' if fortran_order else 'C', offset=data_offset)
+    else:
+        # Compressed member: stream-decompress it to a temporary .npy next to
+        # the archive and map that. The file is unlinked right away; the
+        # mapping keeps it alive (POSIX), so nothing is left behind.
+        try:
+            with zipfile.ZipFile(npz_path) as zf, zf.open(member) as src, \
+                    tempfile.NamedTemporaryFile(suffix='.npy', dir=Path(npz_path).parent) as tmp:
+                shutil.copyfileobj(src, tmp, NPZ_EXTRACT_CHUNK_BYTES)
+                tmp.flush()
+                array = np.load(tmp.name, mmap_mode='r', allow_pickle=False)
+            print(f"Memory-mapping '{key}' from a decompressed copy of {npz_path}")
+            return array
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not extract '{key}' for memory-mapping ({e}), loading into memory")
+    
+    with np.load(npz_path) as data:
+        return data[key]
+
+
+def percentile_partition(data: np.ndarray, q: float) -> float:
+    """
+    q-th percentile of data (same linear interpolation as np.percentile).
+    
+    Uses an O(N) np.partition selection of the two neighbouring order
+    statistics instead of sorting.
+    """
+    flat = data.reshape(-1)
+    rank = q / 100.0 * (flat.size - 1)
+    lo = int(np.floor(rank))
+    hi = min(lo + 1, flat.size - 1)
+    part = np.partition(flat, (lo, hi))
+    lower = float(part[lo])
+    return lower + (float(part[hi]) - lower) * (rank - lo)
+
+
+def normalize_to_uint8(data: np.ndarray, p_min: float, p_max: float, out: np.ndarray) -> None:
+    """Map [p_min, p_max] to [0, 255] and write uint8 into out in one cv2 pass."""
+    depth_range = max(p_max - p_min, 1e-6)
+    scale = 255.0 / depth_range
+    # Values are >= p_min, so the abs in convertScaleAbs is a no-op; it
+    # saturates to [0, 255] and rounds while converting to uint8. Shifting
+    # down by just under half a level turns that rounding into truncation,
+    # matching the previous .clip(0, 255).astype(np.uint8) output
+    width = data.shape[-1]
+    cv2.convertScaleAbs(
+        data.reshape(-1, width), dst=out.reshape(-1, width),
+        alpha=scale, beta=-p_min * scale - 0.499
+    )
 
 
 def process_depth_npz(
@@ -31,6 +277,7 @@ def process_depth_npz(
     log_base: float = LOG_BASE,
     sharpen: float = SHARPEN,
     scene_timestamps: list = None,
+    encoder: str = 'auto',
 ) -> dict:
     """
     Process depth.npz file and save as video.
@@ -43,18 +290,15 @@ def process_depth_npz(
         target_frames: Target number of frames (if None, uses all frames from npz)
         target_duration: Target duration in seconds (if None, calculated from frames and fps)
         scene_timestamps: List of scene start timestamps for per-scene normalization
+        encoder: Video encoder, one of VIDEO_ENCODERS ('auto' uses h264_nvenc when usable, else libx264)
     
     Returns:
         dict with processed scene statistics (min_depths, max_depths, screen_dists)
     """
     print(f"Loading depth data from: {input_npz}")
     
-    # Load depth data
-    data = np.load(input_npz)
-    if 'depth' not in data:
-        raise ValueError(f"No 'depth' key found in {input_npz}. Available keys: {list(data.keys())}")
-    
-    depths = data['depth']
+    # Load depth data (memory-mapped when the npz was written uncompressed)
+    depths = load_npz_array(input_npz, 'depth')
     print(f"Loaded depth array shape: {depths.shape}")
     print(f"Depth range: [{np.min(depths):.4f}, {np.max(depths):.4f}]")
     
@@ -75,81 +319,43 @@ def process_depth_npz(
     
     num_frames, height, width = depths.shape
     print(f"Processing {num_frames} frames at {width}x{height} resolution")
+    if depths.dtype != np.float32:
+        print(f"Depth is {depths.dtype}, processing in float32")
     
-    # Process each frame
-    processed_frames = []
-    for frame_idx, depth_frame in enumerate(depths):
-        if frame_idx % 100 == 0:
-            print(f"Processing frame {frame_idx + 1}/{num_frames}...")
-        
-        # Apply Gaussian blur
-        blurred = ndimage.gaussian_filter(depth_frame, sigma=blur_sigma)
-        
-        # Apply log_base(x+1) transformation
-        # Using natural log (base e) via log1p, then convert to desired base if needed
-        if log_base == np.e:
-            logged = np.log1p(blurred)  # ln(x+1) = log1p(x)
-        else:
-            logged = np.log1p(blurred) / np.log(log_base)  # log_base(x+1)
-        
-        # Sharpen by blending original with blurred: sharpen * original + (1 - sharpen) * blurred
-        # Note: original here refers to the blurred depth before log, logged refers to log(blurred)
-        if sharpen > 0:
-            original_logged = np.log1p(depth_frame) if log_base == np.e else np.log1p(depth_frame) / np.log(log_base)
-            processed = sharpen * original_logged + (1 - sharpen) * logged
+    # Adjust frame count to match target if specified
+    source_indices = np.arange(num_frames)
+    if target_frames is not None and target_frames != num_frames:
+        if target_frames > num_frames:
+            # Repeat last frame to match target
+            frames_to_add = target_frames - num_frames
+            source_indices = np.concatenate([source_indices, np.full(frames_to_add, num_frames - 1)])
+            print(f"Extended frames from {num_frames} to {target_frames} to match reference")
         else:
-            processed = logged
-        
-        processed_frames.append(processed)
-    
-    processed_frames = np.stack(processed_frames, axis=0)
-    
-    # Compute per-scene statistics on processed frames (before normalization)
-    processed_scene_stats = {
-        'min_depths': [],
-        'max_depths': [],
-        'screen_dists': []  # 35th percentile
-    }
+            # Sample frames to match target
+            source_indices = np.linspace(0, num_frames - 1, target_frames).astype(int)
+            print(f"Sampled frames from {num_frames} to {target_frames} to match reference")
+    output_frames = len(source_indices)
     
-    if scene_timestamps and len(scene_timestamps) > 0:
-        scene_frame_indices_stats = [int(ts * fps) for ts in scene_timestamps]
-        scene_frame_indices_stats.append(num_frames)  # Add end boundary
-        
-        for scene_idx in range(len(scene_timestamps)):
-            start_frame = scene_frame_indices_stats[scene_idx]
-            end_frame = scene_frame_indices_stats[scene_idx + 1]
-            
-            start_frame = max(0, min(start_frame, num_frames))
-            end_frame = max(0, min(end_frame, num_frames))
-            
-            if start_frame >= end_frame:
-                processed_scene_stats['min_depths'].append(0.0)
-                processed_scene_stats['max_depths'].append(1.0)
-                processed_scene_stats['screen_dists'].append(0.35)
-                continue
-            
-            scene_data = processed_frames[start_frame:end_frame]
-            p_min = float(np.min(scene_data))
-            p_max = float(np.max(scene_data))
-            p_35 = float(np.percentile(scene_data, 35))
-            
-            processed_scene_stats['min_depths'].append(p_min)
-            processed_scene_stats['max_depths'].append(p_max)
-            processed_scene_stats['screen_dists'].append(p_35)
-        
-        print(f"Computed processed scene statistics for {len(scene_timestamps)} scenes")
+    # Only frames that reach the output are processed. When decimating, the
+    # sampled frames are read chunk by chunk and everything below (scene
+    # ranges, stats, output order) works in positions within that subset
+    frame_indices = np.unique(source_indices)
+    decimated = len(frame_indices) < num_frames
+    source_indices = np.searchsorted(frame_indices, source_indices)
+    num_processed = len(frame_indices)
     
     # Normalize to 0-255 for video encoding
-    # Use per-scene normalization if scene_timestamps provided, otherwise global
-    if scene_timestamps and len(scene_timestamps) > 1:
-        print(f"Using per-scene normalization ({len(scene_timestamps)} scenes)")
-        
+    # Use per-scene normalization if scene_timestamps provided, otherwise global.
+    # The scene ranges are known up front; each scene's min/max is taken as
+    # soon as all of its frames are processed, and its frames are normalized
+    # one at a time while encoding so no full uint8 copy of the stack is kept.
+    # Scene frame ranges, shared by normalization and the per-scene stats
+    scene_ranges = []
+    if scene_timestamps:
         # Convert timestamps to frame indices
         scene_frame_indices = [int(ts * fps) for ts in scene_timestamps]
         scene_frame_indices.append(num_frames)  # Add end boundary
         
-        normalized = np.zeros_like(processed_frames, dtype=np.uint8)
-        
         for scene_idx in range(len(scene_timestamps)):
             start_frame = scene_frame_indices[scene_idx]
             end_frame = scene_frame_indices[scene_idx + 1]
@@ -158,43 +364,25 @@ def process_depth_npz(
             start_frame = max(0, min(start_frame, num_frames))
             end_frame = max(0, min(end_frame, num_frames))
             
-            if start_frame >= end_frame:
-                continue
-            
-            scene_data = processed_frames[start_frame:end_frame]
-            p_min = np.min(scene_data)
-            p_max = np.max(scene_data)
-            depth_range = max(p_max - p_min, 1e-6)
+            # Map to positions among the processed frames
+            start_frame = int(np.searchsorted(frame_indices, start_frame))
+            end_frame = int(np.searchsorted(frame_indices, end_frame))
             
-            normalized[start_frame:end_frame] = (
-                (scene_data - p_min) / depth_range * 255.0
-            ).clip(0, 255).astype(np.uint8)
-            
-            if scene_idx % 10 == 0:
-                print(f"  Scene {scene_idx + 1}: frames {start_frame}-{end_frame}, range [{p_min:.4f}, {p_max:.4f}]")
+            scene_ranges.append((scene_idx, start_frame, end_frame))
+    
+    per_scene = len(scene_ranges) > 1
+    if per_scene:
+        print(f"Using per-scene normalization ({len(scene_timestamps)} scenes)")
+        normalization_scenes = [scene for scene in scene_ranges if scene[1] < scene[2]]
     else:
         print("Using global normalization")
-        p_min = np.min(processed_frames)
-        p_max = np.max(processed_frames)
-        print(f"Processed depth range: [{p_min:.4f}, {p_max:.4f}]")
-        
-        depth_range = max(p_max - p_min, 1e-6)
-        normalized = ((processed_frames - p_min) / depth_range * 255.0).clip(0, 255).astype(np.uint8)
+        normalization_scenes = [(None, 0, num_processed)]
     
-    # Adjust frame count to match target if specified
-    if target_frames is not None and target_frames != num_frames:
-        if target_frames > num_frames:
-            # Repeat last frame to match target
-            last_frame = normalized[-1:]
-            frames_to_add = target_frames - num_frames
-            normalized = np.concatenate([normalized, np.repeat(last_frame, frames_to_add, axis=0)], axis=0)
-            print(f"Extended frames from {num_frames} to {target_frames} to match reference")
-        else:
-            # Sample frames to match target
-            indices = np.linspace(0, num_frames - 1, target_frames).astype(int)
-            normalized = normalized[indices]
-            print(f"Sampled frames from {num_frames} to {target_frames} to match reference")
-        num_frames = target_frames
+    frame_min = np.full(num_processed, np.nan)
+    frame_max = np.full(num_processed, np.nan)
+    # (min, max, 35th percentile) of processed values per scene, before
+    # normalization; filled as scenes close
+    scene_stats = {}
     
     # Encode video using ffmpeg directly for precise control
     print(f"Encoding video to: {output_video}")
@@ -204,12 +392,12 @@ def process_depth_npz(
     if target_duration is not None:
         duration = target_duration
     else:
-        duration = num_frames / fps
-    
-    height, width = normalized.shape[1:3]
+        duration = output_frames / fps
     
     # Build ffmpeg command to encode from numpy arrays via pipe
     # Use h264 codec with exact FPS matching
+    video_encoder = _pick_encoder(encoder)
+    print(f"Using video encoder: {video_encoder}")
     ffmpeg_cmd = [
         'ffmpeg',
         '-y',
@@ -220,9 +408,7 @@ def process_depth_npz(
         '-r', str(fps),
         '-i', '-',
         '-an',  # No audio
-        '-c:v', 'libx264',
-        '-pix_fmt', 'yuv420p',
-        '-crf', '18',
+        *_encoder_args(video_encoder),
         '-r', str(fps),  # Output frame rate (must match input rate for exact timing)
     ]
     
@@ -231,22 +417,174 @@ def process_depth_npz(
     
     ffmpeg_cmd.append(str(output_video))
     
-    # Prepare all frame data as bytes
-    frame_bytes = b''.join(frame.tobytes() for frame in normalized)
-    
-    # Run ffmpeg with frame data piped in
-    result = subprocess.run(
-        ffmpeg_cmd,
-        input=frame_bytes,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg encoding failed: {result.stderr.decode()}")
+    # Blur, log and sharpen straight into one preallocated stack:
+    #   sharpen * log_base(original + 1) + (1 - sharpen) * log_base(blurred + 1)
+    # The base change and blend weights are folded into one scale per term.
+    # Frames are independent and cv2/NumPy release the GIL on whole-array
+    # work, so contiguous chunks of frames run on a thread pool; threads share
+    # the (memory-mapped) input and the output stack without any copying.
+    processed_frames = np.empty((num_processed, height, width), dtype=np.float32)
+    # Per-frame extrema come out of the same pass that writes each frame;
+    # scene ranges then reduce over these instead of re-reading frames
+    processed_min = np.empty(num_processed, dtype=np.float32)
+    processed_max = np.empty(num_processed, dtype=np.float32)
+    # The 1-D kernel is built once and shared by every chunk
+    blur_kernel = gaussian_kernel_1d(blur_sigma) if blur_sigma > 0 else None
+    # Everything stays float32: inputs of another dtype (e.g. float64) are
+    # converted chunk by chunk, and the weights are float32 scalars so no
+    # in-place op can promote a block to float64
+    inv_ln_base = 1.0 if log_base == np.e else 1.0 / np.log(log_base)
+    blurred_weight = np.float32((1 - sharpen) * inv_ln_base if sharpen > 0 else inv_ln_base)
+    original_weight = np.float32(sharpen * inv_ln_base if sharpen > 0 else 0.0)
+    
+    # Each worker thread keeps one scratch block for the whole run, so the
+    # output stack is the only full-size allocation
+    thread_scratch = threading.local()
+    
+    def process_chunk(chunk_start):
+        chunk_end = min(chunk_start + BLUR_CHUNK_FRAMES, num_processed)
+        scratch = getattr(thread_scratch, 'block', None)
+        if scratch is None:
+            scratch = thread_scratch.block = np.empty((BLUR_CHUNK_FRAMES, height, width), dtype=np.float32)
+        if decimated:
+            chunk = np.ascontiguousarray(depths[frame_indices[chunk_start:chunk_end]], dtype=np.float32)
+        else:
+            chunk = np.ascontiguousarray(depths[chunk_start:chunk_end], dtype=np.float32)
+        process_depth_frames(chunk, blur_kernel, blurred_weight, original_weight,
+                             processed_frames[chunk_start:chunk_end], scratch,
+                             processed_min[chunk_start:chunk_end], processed_max[chunk_start:chunk_end])
+        return chunk_end
+    
+    # ffmpeg runs for the whole processing stage: frames are streamed to it
+    # from a writer thread as soon as their scene range is final, so x264
+    # encodes earlier scenes while later ones are still being blurred. The
+    # bounded queue keeps only a few frames in flight. stderr goes to a temp
+    # file so a chatty ffmpeg can't fill the pipe.
+    with tempfile.TemporaryFile() as ffmpeg_log:
+        proc = subprocess.Popen(
+            ffmpeg_cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=ffmpeg_log
+        )
+        write_q = queue.Queue(maxsize=8)
+        
+        def writer():
+            while True:
+                frame = write_q.get()
+                if frame is None:
+                    break
+                try:
+                    # Frames are C-contiguous uint8, so the buffer goes to
+                    # the pipe as-is without a bytes copy
+                    proc.stdin.write(memoryview(frame).cast('B'))
+                except (BrokenPipeError, OSError):
+                    # ffmpeg exited early; keep draining so the producer
+                    # doesn't block, the return code is checked below
+                    pass
+        
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        writer_thread.start()
+        
+        try:
+            next_scene = 0
+            out_pos = 0
+            last_src = None
+            frame = None
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+                # map() yields in order, so frames [0, chunk_end) are all done
+                for chunk_end in pool.map(process_chunk, range(0, num_processed, BLUR_CHUNK_FRAMES)):
+                    if chunk_end % 100 < BLUR_CHUNK_FRAMES or chunk_end == num_processed:
+                        print(f"Processing frame {chunk_end}/{num_processed}...")
+                    
+                    # Close every scene whose frames are all processed
+                    while next_scene < len(normalization_scenes) and normalization_scenes[next_scene][2] <= chunk_end:
+                        scene_idx, start_frame, end_frame = normalization_scenes[next_scene]
+                        p_min = float(processed_min[start_frame:end_frame].min())
+                        p_max = float(processed_max[start_frame:end_frame].max())
+                        if per_scene:
+                            # Stats come from the same pass over the scene
+                            scene_stats[scene_idx] = (
+                                p_min, p_max, percentile_partition(processed_frames[start_frame:end_frame], 35)
+                            )
+                        
+                        frame_min[start_frame:end_frame] = p_min
+                        frame_max[start_frame:end_frame] = p_max
+                        
+                        if scene_idx is None:
+                            print(f"Processed depth range: [{p_min:.4f}, {p_max:.4f}]")
+                        elif scene_idx % 10 == 0:
+                            print(f"  Scene {scene_idx + 1}: frames {start_frame}-{end_frame}, range [{p_min:.4f}, {p_max:.4f}]")
+                        next_scene += 1
+                    
+                    # Frames before the next open scene are final (either in a
+                    # closed scene or outside every scene, which stays black)
+                    if next_scene < len(normalization_scenes):
+                        ready = min(chunk_end, normalization_scenes[next_scene][1])
+                    else:
+                        ready = chunk_end
+                    
+                    while out_pos < output_frames and source_indices[out_pos] < ready:
+                        src = source_indices[out_pos]
+                        # Repeated source frames (extension) reuse the last result
+                        if src != last_src:
+                            frame = np.zeros((height, width), dtype=np.uint8)
+                            if not np.isnan(frame_min[src]):
+                                normalize_to_uint8(processed_frames[src], frame_min[src], frame_max[src], frame)
+                            last_src = src
+                        write_q.put(frame)
+                        out_pos += 1
+            
+            # Per-scene statistics on processed frames (before normalization).
+            # With per-scene normalization they were taken as each scene closed;
+            # a single scene is computed here while ffmpeg finishes the queue.
+            processed_scene_stats = {
+                'min_depths': [],
+                'max_depths': [],
+                'screen_dists': []  # 35th percentile
+            }
+            
+            for scene_idx, start_frame, end_frame in scene_ranges:
+                if start_frame >= end_frame:
+                    p_min, p_max, p_35 = 0.0, 1.0, 0.35
+                elif scene_idx in scene_stats:
+                    p_min, p_max, p_35 = scene_stats[scene_idx]
+                else:
+                    p_min = float(processed_min[start_frame:end_frame].min())
+                    p_max = float(processed_max[start_frame:end_frame].max())
+                    p_35 = percentile_partition(processed_frames[start_frame:end_frame], 35)
+                
+                processed_scene_stats['min_depths'].append(p_min)
+                processed_scene_stats['max_depths'].append(p_max)
+                processed_scene_stats['screen_dists'].append(p_35)
+            
+            if scene_ranges:
+                print(f"Computed processed scene statistics for {len(scene_ranges)} scenes")
+        except BaseException:
+            # Stop ffmpeg before its input is closed so it can't finalize
+            # the frames written so far as if they were the whole video
+            proc.kill()
+            raise
+        finally:
+            # Always end the writer and ffmpeg's input; otherwise an error
+            # above leaves both waiting for frames that never come
+            write_q.put(None)
+            writer_thread.join()
+            try:
+                proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            proc.wait()
+            if proc.returncode != 0:
+                # A killed or failed encode leaves a truncated file behind
+                output_video.unlink(missing_ok=True)
+        
+        if proc.returncode != 0:
+            ffmpeg_log.seek(0)
+            raise RuntimeError(f"ffmpeg encoding failed: {ffmpeg_log.read().decode(errors='replace')}")
     
     print(f"Successfully saved processed depth video to: {output_video}")
-    print(f"  Frames: {num_frames}, FPS: {fps:.6f}, Duration: {duration:.6f}s")
+    print(f"  Frames: {output_frames}, FPS: {fps:.6f}, Duration: {duration:.6f}s")
     
     return processed_scene_stats
 
@@ -294,9 +632,12 @@ def create_export_zip(output_dir: Path, rgb_video: Path, depth_video: Path, meta
     
     print(f"Creating export.zip at: {export_zip}")
     
-    with zipfile.ZipFile(export_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
+    # The videos are already H.264-compressed, so they are stored as-is;
+    # deflating them costs a full zlib pass for no size gain
+    with zipfile.ZipFile(export_zip, 'w', zipfile.ZIP_STORED) as zipf:
         # Add metadata.json
-        zipf.write(metadata_file, os.path.basename(metadata_file))
+        zipf.write(metadata_file, os.path.basename(metadata_file),
+                   compress_type=zipfile.ZIP_DEFLATED, compresslevel=9)
         
         # Add rgb video as rgb.mp4
         zipf.write(rgb_video, "rgb.mp4")
@@ -356,6 +697,13 @@ def main():
         default=None,
         help="Output video path (default: processed_depth.mp4 in input folder)"
     )
+    parser.add_argument(
+        "--encoder",
+        type=str,
+        choices=VIDEO_ENCODERS,
+        default="auto",
+        help="Video encoder for the depth video (default: auto, h264_nvenc when available, else libx264)"
+    )
     parser.add_argument(
         "--export",
         action="store_true",
@@ -418,16 +766,18 @@ def main():
     if fps is None and rgb_video.exists():
         # Extract FPS, duration, and frame count from reference video
         try:
-            # Get FPS
+            # Get FPS, duration, and frame count in a single probe
             cmd = [
                 'ffprobe', '-v', 'error',
                 '-select_streams', 'v:0',
-                '-show_entries', 'stream=r_frame_rate',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
+                '-show_entries', 'stream=r_frame_rate,nb_frames:format=duration',
+                '-of', 'json',
                 str(rgb_video)
             ]
             result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            rate_str = result.stdout.strip()
+            probe = json.loads(result.stdout)
+            stream = probe['streams'][0]
+            rate_str = stream['r_frame_rate']
             if '/' in rate_str:
                 num, den = map(float, rate_str.split('/'))
                 if den > 0:
@@ -435,27 +785,22 @@ def main():
             else:
                 fps = float(rate_str)
             
-            # Get duration
-            cmd = [
-                'ffprobe', '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                str(rgb_video)
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            target_duration = float(result.stdout.strip())
+            target_duration = float(probe['format']['duration'])
             
-            # Get frame count
-            cmd = [
-                'ffprobe', '-v', 'error',
-                '-select_streams', 'v:0',
-                '-count_frames',
-                '-show_entries', 'stream=nb_frames',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                str(rgb_video)
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            target_frames = int(result.stdout.strip())
+            # Containers without a frame count in the header need a full decode to count
+            nb_frames = stream.get('nb_frames')
+            if nb_frames is None or not str(nb_frames).isdigit():
+                cmd = [
+                    'ffprobe', '-v', 'error',
+                    '-select_streams', 'v:0',
+                    '-count_frames',
+                    '-show_entries', 'stream=nb_read_frames',
+                    '-of', 'default=noprint_wrappers=1:nokey=1',
+                    str(rgb_video)
+                ]
+                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+                nb_frames = result.stdout.strip()
+            target_frames = int(nb_frames)
             
             print(f"Detected from {rgb_video.name}:")
             print(f"  FPS: {fps:.6f}")
@@ -480,6 +825,7 @@ def main():
         log_base=args.log_base,
         sharpen=args.sharpen,
         scene_timestamps=scene_timestamps,
+        encoder=args.encoder,
     )
     
     # Update metadata with postprocessing info and scene stats
@@ -5,6 +5,7 @@ Uses da3 Python API directly - NO video encoding.
 """
 
 import argparse
+import atexit
 import cv2
 import numpy as np
 import subprocess
@@ -12,29 +13,86 @@ import sys
 from pathlib import Path
 import tempfile
 import shutil
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
 
-def extract_frames_from_video(video_path: Path, output_dir: Path) -> list[Path]:
-    """Extract all frames from video to output directory, returns list of frame paths in order."""
+SHM_DIR = Path("/dev/shm")  # tmpfs for temporary frames, when present
+SHM_SPACE_MARGIN = 1.25  # tmpfs is only used if it has this multiple of the raw frame bytes free
+MIN_FRAMES_PER_SEGMENT = 64  # Shorter scenes are extracted by a single ffmpeg
+
+def _extract_segment(video_path: Path, frame_pattern: Path, first_frame: int, num_frames: int = None,
+                     seek_seconds: float = None, first_pts: int = None) -> subprocess.CompletedProcess:
+    """Extract num_frames frames (all remaining if None) starting at frame index first_frame (0-based).
+    
+    Segments after the first seek to the keyframe at or before seek_seconds
+    and keep frames from first_pts on, so the cut lands on the exact frame
+    whatever the keyframe spacing or container start offset.
+    """
+    cmd = ['ffmpeg']
+    vf = []
+    if seek_seconds is not None:
+        # Keyframe seek with original timestamps kept, then select by PTS
+        cmd += ['-copyts', '-noaccurate_seek', '-ss', f'{seek_seconds:.6f}']
+        vf = ['-vf', f'select=gte(pts\\,{first_pts})']
+    cmd += [
+        '-i', str(video_path),
+        *vf,
+        '-vsync', '0',  # Don't duplicate/drop frames
+        *(['-frames:v', str(num_frames)] if num_frames is not None else []),
+        '-start_number', str(first_frame + 1),  # ffmpeg numbering is 1-based
+        # da3 reads these straight back, so spend as little time in zlib as possible
+        '-pix_fmt', 'rgb24',
+        '-compression_level', '1',
+        '-pred', 'none',
+        '-y',
+        str(frame_pattern)
+    ]
+    return subprocess.run(cmd, capture_output=True, text=True)
+
+def extract_frames_from_video(video_path: Path, output_dir: Path,
+                              pts_values: list[int] = None, timebase: str = None) -> list[Path]:
+    """Extract all frames from video to output directory, returns list of frame paths in order.
+    
+    When the frame PTS values and timebase are given, the video is split into
+    frame-exact segments that are extracted by parallel ffmpeg processes (PNG
+    encoding is single-threaded per process).
+    """
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # Use ffmpeg to extract frames
     # ffmpeg's %06d pattern starts from 1, so frame_000001.png is the first frame
     frame_pattern = output_dir / "frame_%06d.png"
-    cmd = [
-        'ffmpeg', '-i', str(video_path),
-        '-vsync', '0',  # Don't duplicate/drop frames
-        '-start_number', '1',  # Start numbering from 1
-        '-y',
-        str(frame_pattern)
-    ]
     
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"Error extracting frames: {result.stderr}", file=sys.stderr)
-        sys.exit(1)
+    num_segments = 1
+    if pts_values and timebase:
+        num_segments = max(1, min(os.cpu_count() or 1, len(pts_values) // MIN_FRAMES_PER_SEGMENT))
     
-    # Get all extracted frames in order
-    frame_files = sorted(output_dir.glob("frame_*.png"), key=lambda p: int(p.stem.split('_')[1]))
+    if num_segments == 1:
+        results = [_extract_segment(video_path, frame_pattern, 0)]
+    else:
+        tb = Fraction(timebase)
+        bounds = np.linspace(0, len(pts_values), num_segments + 1).astype(int)
+        jobs = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == 0:
+                jobs.append((video_path, frame_pattern, 0, int(end)))
+            else:
+                # Seek relative to the first frame; the container start is at
+                # or before it, so the keyframe found is never past the cut
+                seek = float((pts_values[start] - pts_values[0]) * tb)
+                jobs.append((video_path, frame_pattern, int(start), int(end - start), seek, pts_values[start]))
+        with ThreadPoolExecutor(max_workers=num_segments) as pool:
+            results = list(pool.map(lambda job: _extract_segment(*job), jobs))
+    
+    for result in results:
+        if result.returncode != 0:
+            print(f"Error extracting frames: {result.stderr}", file=sys.stderr)
+            sys.exit(1)
+    
+    # Get all extracted frames in order; %06d names are zero-padded, so the
+    # lexical order is the numeric order
+    frame_files = sorted(output_dir.glob("frame_*.png"))
     if len(frame_files) == 0:
         print(f"Warning: No frames extracted. Checked pattern: {output_dir / 'frame_*.png'}", file=sys.stderr)
         # List what files actually exist
@@ -43,32 +101,57 @@ def extract_frames_from_video(video_path: Path, output_dir: Path) -> list[Path]:
             print(f"Found files in directory: {[f.name for f in existing_files[:10]]}", file=sys.stderr)
     return frame_files
 
+def pick_frames_dir(video_path: Path, num_frames: int, fallback_dir: Path) -> Path:
+    """Temporary tmpfs directory for the extracted frames if they fit in SHM_DIR, else fallback_dir.
+    
+    The rgb24 PNGs are written with almost no compression, so their size is
+    estimated as frames x width x height x 3. Small shm mounts (64 MB by
+    default under Docker) would otherwise fail the extraction with ENOSPC.
+    """
+    if not SHM_DIR.is_dir():
+        return fallback_dir
+    
+    cap = cv2.VideoCapture(str(video_path))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    needed = num_frames * width * height * 3 * SHM_SPACE_MARGIN
+    try:
+        free = shutil.disk_usage(SHM_DIR).free
+        if width > 0 and height > 0 and needed <= free:
+            return Path(tempfile.mkdtemp(prefix="da3_frames_", dir=SHM_DIR))
+    except OSError as e:
+        print(f"Note: {SHM_DIR} unusable ({e})")
+    else:
+        print(f"Note: frames need ~{needed / 2**20:.0f} MB, {free / 2**20:.0f} MB free in {SHM_DIR}")
+    print(f"  Writing frames to {fallback_dir} instead")
+    return fallback_dir
+
 def get_video_pts_timestamps(video_path: Path) -> tuple[list[int], str]:
     """Extract integer PTS timestamps and timebase from video.
     Returns (pts_values, timebase_string) where pts_values are integers with no precision loss."""
-    # Extract integer PTS values
-    pts_cmd = [
-        'ffprobe', '-v', 'error',
-        '-select_streams', 'v:0',
-        '-show_entries', 'frame=pkt_pts',
-        '-of', 'csv=p=0',
-        str(video_path)
-    ]
-    
-    pts_result = subprocess.run(pts_cmd, capture_output=True, text=True, check=True)
-    pts_values = [int(x.strip()) for x in pts_result.stdout.strip().split('\n') if x.strip()]
-    
-    # Extract timebase
-    tb_cmd = [
+    # Extract integer PTS values and the stream timebase in one pass; the
+    # default csv writer prefixes each line with its section name
+    cmd = [
         'ffprobe', '-v', 'error',
         '-select_streams', 'v:0',
-        '-show_entries', 'stream=time_base',
-        '-of', 'csv=p=0',
+        '-show_entries', 'frame=pkt_pts:stream=time_base',
+        '-of', 'csv',
         str(video_path)
     ]
     
-    tb_result = subprocess.run(tb_cmd, capture_output=True, text=True, check=True)
-    timebase = tb_result.stdout.strip()
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    pts_values = []
+    timebase = ''
+    for line in result.stdout.splitlines():
+        section, _, value = line.strip().partition(',')
+        value = value.strip().rstrip(',')
+        if not value:
+            continue
+        if section == 'frame':
+            pts_values.append(int(value))
+        elif section == 'stream':
+            timebase = value
     
     return pts_values, timebase
 
@@ -162,14 +245,19 @@ def main():
     rgb_pts, rgb_timebase = get_video_pts_timestamps(scene_video)
     print(f"  Found {len(rgb_pts)} frames with integer PTS timestamps (timebase: {rgb_timebase})")
     
-    # Extract frames from scene video
+    # Extract frames from scene video. They are only written so da3 can read
+    # them straight back, so by default they go to tmpfs when it is available
+    # and the PNG round-trip never touches the disk
     if args.frames_dir:
         frames_dir = Path(args.frames_dir)
     else:
-        frames_dir = output_npz.parent / "temp_frames"
+        frames_dir = pick_frames_dir(scene_video, len(rgb_pts), output_npz.parent / "temp_frames")
+        # Removed on every exit path, so a failed run doesn't leave frames
+        # holding memory in /dev/shm
+        atexit.register(shutil.rmtree, frames_dir, ignore_errors=True)
     
     print(f"Extracting frames from {scene_video}...")
-    frame_files = extract_frames_from_video(scene_video, frames_dir)
+    frame_files = extract_frames_from_video(scene_video, frames_dir, rgb_pts, rgb_timebase)
     print(f"  Extracted {len(frame_files)} frames")
     
     # CRITICAL: Frame count must match exactly
@@ -213,10 +301,6 @@ def main():
         print(f"  Depth shape: {depth_frames.shape}", file=sys.stderr)
         sys.exit(1)
     
-    # Clean up frames directory if we created it
-    if not args.frames_dir and frames_dir.exists():
-        shutil.rmtree(frames_dir)
-    
     # Save integer PTS timestamps for later use in video encoding
     pts_file = output_npz.parent / "rgb_pts.npy"
     np.save(str(pts_file), np.array(rgb_pts, dtype=np.int64))
@@ -3,25 +3,28 @@ from spatialstudio import splv
 import numpy as np
 import cv2
 
-def make_bounds_cubic(world_min, world_max):
-    world_min = np.array(world_min, dtype=float)
-    world_max = np.array(world_max, dtype=float)
+def make_bounds_cubic(world_min, world_max, out=None):
+    world_min = np.asarray(world_min, dtype=float)
+    world_max = np.asarray(world_max, dtype=float)
 
-    # Compute the current extents
-    size = world_max - world_min
-    max_extent = np.max(size)
+    # Keep the center and expand every axis to the largest extent
+    center = 0.5 * (world_min + world_max)
+    half_extent = 0.5 * np.max(world_max - world_min)
 
-    # Compute padding for each axis to make them all equal to max_extent
-    pad = (max_extent - size) / 2.0
+    # out=(min_array, max_array) writes in place, e.g. when looping over scenes
+    if out is not None:
+        new_min, new_max = out
+        np.subtract(center, half_extent, out=new_min)
+        np.add(center, half_extent, out=new_max)
+        return new_min, new_max
 
-    # Expand bounds symmetrically
-    new_min = world_min - pad
-    new_max = world_max + pad
-
-    return tuple(new_min), tuple(new_max)
+    return tuple(center - half_extent), tuple(center + half_extent)
 
 # Read depth from a npy file
 depth = np.load("processing/vda_metric_outputs/depth_npy/snow_fountain_frame_1.npy")
+if depth.dtype == np.uint16:
+    # uint16 depth maps hold millimetres
+    depth = depth.astype(np.float32) / 1000.0
 
 max_depth = 50.0
 depth[depth > max_depth] = max_depth
@@ -52,16 +55,29 @@ print(image.shape)
 
 w, h, d = 760, 760, 760
 
-minPos = (0, 0, 0)
-maxPos = (1, 1, 1)
-
-breakpoint()
-
-new_frame, minPos, maxPos = splv.Frame.from_rgbd(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d)
-
-minPos, maxPos = make_bounds_cubic(minPos, maxPos)
-
-new_frame, _, _ = splv.Frame.from_rgbd(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d)
+# World bounds straight from the back-projected depth, so from_rgbd only has
+# to voxelize once. The extrinsics are identity, so camera space is world
+# space: X = (u - cx) * Z / fx, Y = (v - cy) * Z / fy, Z = depth
+valid = np.isfinite(depth) & (depth > 0)
+z = np.where(valid, depth, np.nan)
+x = z * ((np.arange(width) - intrinsics[0, 2]) / intrinsics[0, 0])[np.newaxis, :]
+y = z * ((np.arange(height) - intrinsics[1, 2]) / intrinsics[1, 1])[:, np.newaxis]
+point_min = (np.nanmin(x), np.nanmin(y), np.nanmin(z))
+point_max = (np.nanmax(x), np.nanmax(y), np.nanmax(z))
+
+minPos, maxPos = make_bounds_cubic(point_min, point_max)
+
+new_frame, rgbd_min, rgbd_max = splv.Frame.from_rgbd(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d)
+
+# The bounds above assume from_rgbd's OpenCV pinhole convention (pixel v and
+# camera y both point down, z forward, extrinsics world-to-camera). from_rgbd
+# returns the bounds of the points it back-projected; if they differ the guess
+# was wrong, so voxelize once more with cubic bounds built from its own
+extent = np.max(np.subtract(point_max, point_min))
+if not (np.allclose(rgbd_min, point_min, atol=1e-4 * extent) and np.allclose(rgbd_max, point_max, atol=1e-4 * extent)):
+    print("Note: from_rgbd point bounds differ from the back-projected ones, voxelizing again with its bounds")
+    minPos, maxPos = make_bounds_cubic(rgbd_min, rgbd_max)
+    new_frame, _, _ = splv.Frame.from_rgbd(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d)
 
 new_frame.save("processing/frames/snow_fountain_frame_0_projected.vv")
 
@@ -78,7 +94,6 @@ encoder.encode(new_frame)
 encoder.finish()
 
 # Try rendering the frame
-breakpoint()
 render, output_depth = splv.Frame.render(new_frame, image.shape[1], image.shape[0], intrinsics, extrinsics)
 cv2.imwrite("processing/frames/snow_fountain_frame_0_rendered.png", render)
 
@@ -3,6 +3,8 @@ from PIL import Image
 import numpy as np
 import json
 
+DEPTH_SCALE = 1000.0  # Stored depth units per world unit (uint16 millimetres)
+
 def find_extrinsics(camPos, camTarget):
     """
     Compute camera extrinsics matrix from camera position and target.
@@ -14,31 +16,43 @@ def find_extrinsics(camPos, camTarget):
     Returns:
         extrinsics: 3x4 numpy array representing the extrinsics matrix
     """
-    camPos = np.array(camPos, dtype=np.float32)
-    camTarget = np.array(camTarget, dtype=np.float32)
+    return find_extrinsics_batch(np.reshape(camPos, (1, 3)), np.reshape(camTarget, (1, 3)))[0]
+
+
+def find_extrinsics_batch(camPositions, camTargets):
+    """
+    Compute extrinsics for a whole camera path at once.
+    
+    Args:
+        camPositions: (N, 3) camera positions
+        camTargets: (N, 3) camera target points
+    
+    Returns:
+        extrinsics: (N, 3, 4) float32 array, one extrinsics matrix per camera
+    """
+    camPositions = np.asarray(camPositions, dtype=np.float32)
+    camTargets = np.asarray(camTargets, dtype=np.float32)
     
     # Compute forward vector (normalized direction from camPos to camTarget)
-    forward = camTarget - camPos
-    forward = forward / np.linalg.norm(forward)
+    forward = camTargets - camPositions
+    forward /= np.linalg.norm(forward, axis=-1, keepdims=True)
     
-    # World up vector
+    # Compute right vector (normalized cross product of world up and forward)
     up = np.array([0.0, 1.0, 0.0], dtype=np.float32)
-    
-    # Compute right vector (normalized cross product of up and forward)
     right = np.cross(up, forward)
-    right = right / np.linalg.norm(right)
+    right /= np.linalg.norm(right, axis=-1, keepdims=True)
     
     # Recompute up vector (normalized cross product of forward and right)
     up = np.cross(forward, right)
-    up = up / np.linalg.norm(up)
+    up /= np.linalg.norm(up, axis=-1, keepdims=True)
     
-    # Build extrinsics matrix (3x4)
-    # Translation component is negative dot product of each axis with camPos
-    extrinsics = np.array([
-        [right[0], right[1], right[2], -np.dot(right, camPos)],
-        [up[0], up[1], up[2], -np.dot(up, camPos)],
-        [forward[0], forward[1], forward[2], -np.dot(forward, camPos)]
-    ], dtype=np.float32)
+    # Build extrinsics matrices (N, 3, 4): rows are the camera axes and the
+    # translation is the negative dot product of each axis with camPos
+    extrinsics = np.empty((len(camPositions), 3, 4), dtype=np.float32)
+    extrinsics[:, 0, :3] = right
+    extrinsics[:, 1, :3] = up
+    extrinsics[:, 2, :3] = forward
+    extrinsics[:, :, 3] = -np.einsum('nij,nj->ni', extrinsics[:, :, :3], camPositions)
     
     return extrinsics
 
@@ -55,23 +69,36 @@ def find_intrinsics(imageWidth, imageHeight, camFov):
     Returns:
         intrinsics: 3x3 numpy array representing the intrinsics matrix
     """
-    # Convert FOV from degrees to radians
-    fovY = np.deg2rad(camFov)
+    return find_intrinsics_batch(imageWidth, imageHeight, camFov)[0]
+
+
+def find_intrinsics_batch(imageWidths, imageHeights, camFovs):
+    """
+    Compute intrinsics for N views at once; scalars broadcast.
     
-    # Compute focal length
-    fy = 0.5 * imageHeight / np.tan(0.5 * fovY)
-    fx = fy  # TODO: why does it get stretched with non-square focal lengths?
+    Args:
+        imageWidths: width(s) of the image in pixels
+        imageHeights: height(s) of the image in pixels
+        camFovs: field(s) of view in degrees
     
-    # Principal point (image center)
-    cx = imageWidth * 0.5
-    cy = imageHeight * 0.5
+    Returns:
+        intrinsics: (N, 3, 3) float32 array
+    """
+    imageWidths, imageHeights, camFovs = np.broadcast_arrays(
+        np.atleast_1d(imageWidths), np.atleast_1d(imageHeights), np.atleast_1d(camFovs)
+    )
+    
+    # Compute focal length from the vertical FOV
+    fy = 0.5 * imageHeights / np.tan(0.5 * np.deg2rad(camFovs))
+    fx = fy  # TODO: why does it get stretched with non-square focal lengths?
     
-    # Build intrinsics matrix (3x3)
-    intrinsics = np.array([
-        [fx, 0.0, cx],
-        [0.0, fy, cy],
-        [0.0, 0.0, 1.0]
-    ], dtype=np.float32)
+    # Build intrinsics matrices (N, 3, 3) with the principal point at the image center
+    intrinsics = np.zeros((len(fy), 3, 3), dtype=np.float32)
+    intrinsics[:, 0, 0] = fx
+    intrinsics[:, 1, 1] = fy
+    intrinsics[:, 0, 2] = imageWidths * 0.5
+    intrinsics[:, 1, 2] = imageHeights * 0.5
+    intrinsics[:, 2, 2] = 1.0
     
     return intrinsics
 
@@ -88,7 +115,13 @@ img, depth = frame.render(width=1024, height=1024, fov=80, camPos=(1, 0.1, -1),
 # breakpoint()
 # turn the image from numpy array to PIL image
 img = Image.fromarray(img)
-np.save("processing/frames/frame_0_depth.npy", depth)
+# Depth is stored as uint16 millimetres (1 mm steps up to 65.535), half the
+# size of float32; pixels without a valid depth are written as 0
+depth_mm = np.where(np.isfinite(depth) & (depth > 0), depth * DEPTH_SCALE, 0)
+clipped = int(np.count_nonzero(depth_mm > 65535))
+if clipped:
+    print(f"Warning: {clipped} depth pixels beyond {65535 / DEPTH_SCALE} world units clipped to that distance")
+np.save("processing/frames/frame_0_depth.npy", np.clip(np.rint(depth_mm), 0, 65535).astype(np.uint16))
 img.save("processing/frames/frame_0.png")
 depth_img = Image.fromarray((depth * 255 / depth.max()).astype(np.uint8))
 depth_img.save("processing/frames/frame_0_depth.png")
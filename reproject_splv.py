@@ -1,16 +1,231 @@
 import json
+import os
 from spatialstudio import splv
 import numpy as np
 import cv2
 
+try:
+    import numba
+except ImportError:  # Optional: NumPy fallback below
+    numba = None
+
+DEPTH_SCALE = 1000.0  # Stored depth units per world unit (uint16 millimetres)
+# Voxelizer: "splv" (splv.Frame.from_rgbd), "local" (z-buffered backproject_rgbd)
+# or "auto" (splv when the installed build has from_rgbd, else local)
+SPLV_PROJECTION = os.getenv("SPLV_PROJECTION", "auto")
+# Set to 1 to run both voxelizers on the sample frame and compare them
+SPLV_PROJECTION_CHECK = os.getenv("SPLV_PROJECTION_CHECK", "0") == "1"
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _unproject_kernel(depth, fx, fy, cx, cy, rot_inv, cam_pos, out):
+        """Back-project every pixel to world space into out (3, H*W); invalid depths become NaN."""
+        height, width = depth.shape
+        for v in numba.prange(height):
+            for u in range(width):
+                i = v * width + u
+                z = depth[v, u]
+                if not (z > 0.0 and z < np.inf):
+                    out[0, i] = np.nan
+                    out[1, i] = np.nan
+                    out[2, i] = np.nan
+                    continue
+                x = (u - cx) * z / fx
+                y = (v - cy) * z / fy
+                for a in range(3):
+                    out[a, i] = rot_inv[a, 0] * x + rot_inv[a, 1] * y + rot_inv[a, 2] * z + cam_pos[a]
+else:
+    _unproject_kernel = None
+
+
+def load_depth(path):
+    """Load a depth .npy as float32 world units; uint16 files hold millimetres (0 = no depth)."""
+    depth = np.load(path)
+    if depth.dtype == np.uint16:
+        return depth.astype(np.float32) / DEPTH_SCALE
+    return depth.astype(np.float32, copy=False)
+
+
+def unproject_depth(depth, intrinsics, extrinsics):
+    """
+    Back-project a depth map to world-space points.
+    
+    Args:
+        depth: (H, W) depth map
+        intrinsics: 3x3 pinhole matrix
+        extrinsics: 3x4 (or 4x4) world-to-camera [R|t], OpenCV axes
+            (y down, z forward; see project_once)
+    
+    Returns:
+        (3, H*W) float32 points in pixel order, NaN where the depth is invalid.
+        Each coordinate is its own contiguous row, so per-axis passes
+        (bounds, quantization) read only that axis.
+    """
+    depth = np.ascontiguousarray(depth, dtype=np.float32)
+    K = np.asarray(intrinsics, dtype=np.float32)
+    E = np.asarray(extrinsics, dtype=np.float32)[:3]
+    rot_inv = np.ascontiguousarray(E[:, :3].T)
+    cam_pos = -rot_inv @ E[:, 3]
+    fx, fy, cx, cy = K[0, 0], K[1, 1], K[0, 2], K[1, 2]
+    
+    height, width = depth.shape
+    points = np.empty((3, height * width), dtype=np.float32)
+    if _unproject_kernel is not None:
+        _unproject_kernel(depth, fx, fy, cx, cy, rot_inv, cam_pos, points)
+        return points
+    
+    z = np.where((depth > 0) & np.isfinite(depth), depth, np.nan)
+    x = z * ((np.arange(width, dtype=np.float32) - cx) / fx)[np.newaxis, :]
+    y = z * ((np.arange(height, dtype=np.float32) - cy) / fy)[:, np.newaxis]
+    camera = np.stack([x.ravel(), y.ravel(), z.ravel()])
+    np.matmul(rot_inv, camera, out=points)
+    points += cam_pos[:, np.newaxis]
+    return points
+
+
+def backproject_rgbd(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d):
+    """
+    NumPy/Numba stand-in for splv.Frame.from_rgbd.
+    
+    Points are quantized into a w x h x d grid spanning [minPos, maxPos];
+    when several pixels land in one voxel the one nearest the camera wins
+    (a z-buffered splat), so hidden surfaces never overwrite visible ones.
+    
+    Returns:
+        (frame, point_min, point_max) where point_min/max bound the valid points
+    """
+    points = unproject_depth(depth, intrinsics, extrinsics)
+    valid = ~np.isnan(points[0])
+    points = points[:, valid]
+    point_min = tuple(points.min(axis=1).tolist())
+    point_max = tuple(points.max(axis=1).tolist())
+    
+    # Voxels are kept structure-of-arrays: one packed (x, y, z) id per
+    # point, with depth and color in separate arrays that are only gathered
+    # for the points that survive
+    lo = np.asarray(minPos, dtype=np.float32)
+    hi = np.asarray(maxPos, dtype=np.float32)
+    voxel_ids = np.zeros(points.shape[1], dtype=np.int64)
+    inside = np.ones(points.shape[1], dtype=bool)
+    for axis, size in enumerate((w, h, d)):
+        coord = np.floor((points[axis] - lo[axis]) * (size / (hi[axis] - lo[axis]))).astype(np.int64)
+        # Points on the maxPos face land one past the grid; they belong to the last voxel
+        np.minimum(coord, size - 1, out=coord, where=points[axis] <= hi[axis])
+        inside &= (coord >= 0) & (coord < size)
+        voxel_ids *= size
+        voxel_ids += coord
+    source = np.flatnonzero(valid)[inside]
+    voxel_ids = voxel_ids[inside]
+    camera_depth = depth.reshape(-1)[source]
+    
+    # Z-buffer: sort by voxel, then by depth, and keep the nearest pixel of
+    # each voxel (the first of its run)
+    order = np.lexsort((camera_depth, voxel_ids))
+    sorted_ids = voxel_ids[order]
+    nearest = np.empty(len(order), dtype=bool)
+    nearest[:1] = True
+    np.not_equal(sorted_ids[1:], sorted_ids[:-1], out=nearest[1:])
+    keep = order[nearest]
+    
+    kept_ids = voxel_ids[keep]
+    xs, rest = np.divmod(kept_ids, h * d)
+    ys, zs = np.divmod(rest, d)
+    # image is BGR as read by cv2; the voxels are RGB
+    colors = image.reshape(-1, 3)[source[keep]][:, ::-1]
+    
+    frame = splv.Frame(w, h, d)
+    # splv.Frame only exposes per-voxel assignment
+    for x, y, z, (r, g, b) in zip(xs.tolist(), ys.tolist(), zs.tolist(), colors.tolist()):
+        frame[x, y, z] = (r, g, b)
+    return frame, point_min, point_max
+
+
+def select_projection(name):
+    """
+    Pick the RGB-D voxelizer by SPLV_PROJECTION name.
+    
+    Returns:
+        A callable with the splv.Frame.from_rgbd signature
+    """
+    from_rgbd = getattr(splv.Frame, "from_rgbd", None)
+    if name == "auto":
+        return from_rgbd or backproject_rgbd
+    if name == "local":
+        return backproject_rgbd
+    if name == "splv":
+        if from_rgbd is None:
+            raise RuntimeError("SPLV_PROJECTION=splv but this spatialstudio build has no Frame.from_rgbd")
+        return from_rgbd
+    raise ValueError(f"Unknown SPLV_PROJECTION: {name!r} (expected auto, local or splv)")
+
+
+project_rgbd = select_projection(SPLV_PROJECTION)
+
+
+def projection_bounds(depth, intrinsics, extrinsics):
+    """World bounds (minPos, maxPos) of the valid back-projected points."""
+    points = unproject_depth(depth, intrinsics, extrinsics)
+    return tuple(np.nanmin(points, axis=1).tolist()), tuple(np.nanmax(points, axis=1).tolist())
+
+
+def bounds_match(min_a, max_a, min_b, max_b):
+    """True if two (min, max) bounds agree to within 1e-4 of their extent."""
+    extent = np.max(np.subtract(max_b, min_b))
+    return np.allclose(min_a, min_b, atol=1e-4 * extent) and np.allclose(max_a, max_b, atol=1e-4 * extent)
+
+
+def project_once(image, depth, intrinsics, extrinsics, w, h, d, project=None):
+    """
+    Project with bounds taken from the valid back-projected points, in a single voxelization pass.
+    
+    unproject_depth assumes an OpenCV pinhole (pixel v and camera y both
+    point down, z forward), while render_view's find_extrinsics_batch
+    builds a y-up camera row. from_rgbd reports the bounds of the points
+    it back-projected; if those differ from ours the guess was wrong, and
+    the frame is voxelized again with the reported bounds (the old
+    two-pass flow) rather than kept on a skewed grid.
+    
+    Returns:
+        (frame, point_min, point_max) as reported by the voxelizer
+    """
+    project = project or project_rgbd
+    minPos, maxPos = projection_bounds(depth, intrinsics, extrinsics)
+    frame, point_min, point_max = project(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d)
+    # The local voxelizer reports projection_bounds itself; nothing to check
+    if project is not backproject_rgbd and not bounds_match(point_min, point_max, minPos, maxPos):
+        print("Note: voxelizer point bounds differ from unproject_depth's, voxelizing again with its bounds")
+        frame, point_min, point_max = project(image, depth, intrinsics, extrinsics, point_min, point_max, w, h, d)
+    return frame, point_min, point_max
+
+
+def compare_projections(image, depth, intrinsics, extrinsics, w, h, d):
+    """
+    Voxelize one frame with both splv.Frame.from_rgbd and backproject_rgbd.
+    
+    Prints the point bounds each reports and saves the local frame next to
+    the splv one, so the two can be diffed in a viewer.
+    
+    Returns:
+        True if both report the same point bounds
+    """
+    from_rgbd = select_projection("splv")
+    _, splv_min, splv_max = project_once(image, depth, intrinsics, extrinsics, w, h, d, project=from_rgbd)
+    local_frame, local_min, local_max = project_once(image, depth, intrinsics, extrinsics, w, h, d, project=backproject_rgbd)
+    local_frame.save("processing/frames/frame_0_reprojected_local.vv")
+    
+    match = bounds_match(local_min, local_max, splv_min, splv_max)
+    print(f"from_rgbd bounds: {splv_min} .. {splv_max}")
+    print(f"local bounds:     {local_min} .. {local_max}")
+    print(f"Projection check: {'bounds match' if match else 'BOUNDS DIFFER'}")
+    return match
 
 
 # Read extrinsics and intrinsics from a json file
 extrinsics = json.load(open("processing/frames/frame_0_extrinsics_intrinsics.json"))["extrinsics"]
 intrinsics = json.load(open("processing/frames/frame_0_extrinsics_intrinsics.json"))["intrinsics"]
 
-# Read depth from a npy file
-depth = np.load("processing/frames/frame_0_depth.npy")
+# Read depth from a npy file (uint16 millimetres from render_view.py)
+depth = load_depth("processing/frames/frame_0_depth.npy")
 
 # Read image from a png file
 image = cv2.imread("processing/frames/frame_0.png")
@@ -19,23 +234,15 @@ original_frame = splv.Frame.load("processing/frames/frame_0.vv")
 # Get size of the original frame
 w, h, d = original_frame.get_dims()
 
-minPos = (0, 0, 0)
-maxPos = (w, h, d)
-# project image + depth into 3d voxels
-
-_, minPos, maxPos = splv.Frame.from_rgbd(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d)
+if SPLV_PROJECTION_CHECK:
+    compare_projections(image, depth, intrinsics, extrinsics, w, h, d)
 
-new_frame, _, _ = splv.Frame.from_rgbd(image, depth, intrinsics, extrinsics, minPos, maxPos, w, h, d)
+# project image + depth into 3d voxels; the first from_rgbd call was only
+# used for the point bounds, so take those from the back-projection instead
+new_frame, _, _ = project_once(image, depth, intrinsics, extrinsics, w, h, d)
 
 new_frame.save("processing/frames/frame_0_reprojected.vv")
 
-# load the original frame
-original_frame = splv.Frame.load("processing/frames/frame_0.vv")
-
-combined_frame = original_frame.clone()
-combined_frame.add(new_frame)
-combined_frame.save("processing/frames/frame_0_combined.vv")
-
 # Debug: cycle through the original frame, new frame, and the combined frame
 
 encoder = splv.Encoder(
@@ -46,5 +253,12 @@ encoder = splv.Encoder(
 
 encoder.encode(original_frame)
 encoder.encode(new_frame)
+
+# The original is already encoded, so merge into it in place instead of
+# cloning it first
+combined_frame = original_frame
+combined_frame.add(new_frame)
+combined_frame.save("processing/frames/frame_0_combined.vv")
+
 encoder.encode(combined_frame)
-encoder.finish()
\ No newline at end of file
+encoder.finish()
@@ -20,9 +20,13 @@ except ImportError as e:
     print("Make sure you're in the correct environment and diffusers is installed.", file=sys.stderr)
     sys.exit(1)
 
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+BATCH_SIZE = 4  # Images per pipeline call in directory mode
+
+
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python run_marigold_normals.py <input_image> [output_path]", file=sys.stderr)
+        print("Usage: python run_marigold_normals.py <input_image|input_dir> [output_path|output_dir]", file=sys.stderr)
         sys.exit(1)
     
     input_image_path = sys.argv[1]
@@ -32,13 +36,27 @@ def main():
         print(f"Error: Input image not found: {input_image_path}", file=sys.stderr)
         sys.exit(1)
     
-    # Generate output path if not provided
-    if output_path is None:
-        input_path = Path(input_image_path)
-        output_path = str(input_path.parent / f"{input_path.stem}_normals.png")
-    
-    print(f"Loading image: {input_image_path}")
-    print(f"Output will be saved to: {output_path}")
+    # A directory is processed as one batch job so the pipeline is only
+    # loaded (and copied to the GPU) once for all of its images
+    input_path = Path(input_image_path)
+    if input_path.is_dir():
+        input_images = sorted(p for p in input_path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not input_images:
+            print(f"Error: No images found in {input_image_path}", file=sys.stderr)
+            sys.exit(1)
+        output_dir = Path(output_path) if output_path else input_path.parent / f"{input_path.name}_normals"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_paths = [str(output_dir / f"{p.stem}_normals.png") for p in input_images]
+        print(f"Found {len(input_images)} images in: {input_image_path}")
+        print(f"Output will be saved to: {output_dir}")
+    else:
+        # Generate output path if not provided
+        if output_path is None:
+            output_path = str(input_path.parent / f"{input_path.stem}_normals.png")
+        input_images = [input_path]
+        output_paths = [output_path]
+        print(f"Loading image: {input_image_path}")
+        print(f"Output will be saved to: {output_path}")
     
     # Check for CUDA
     device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -52,20 +70,43 @@ def main():
             variant="fp16" if device == "cuda" else None,
             torch_dtype=dtype
         ).to(device)
+        if device == "cuda":
+            try:
+                pipe.enable_xformers_memory_efficient_attention()
+            except ImportError as e:  # Optional: xformers not installed
+                print(f"Note: xformers unavailable ({e}), using default attention")
         
-        print("Loading input image...")
-        image = load_image(input_image_path)
-        
-        print("Generating normal map (this may take a while)...")
-        normals = pipe(image)
+        with torch.inference_mode():
+            for start in range(0, len(input_images), BATCH_SIZE):
+                batch_inputs = input_images[start:start + BATCH_SIZE]
+                batch_outputs = output_paths[start:start + BATCH_SIZE]
+                
+                print("Loading input image..." if len(input_images) == 1
+                      else f"Loading images {start + 1}-{start + len(batch_inputs)}/{len(input_images)}...")
+                images = [load_image(str(p)) for p in batch_inputs]
+                
+                # The pipeline only batches images of one size, so each
+                # size in the batch gets its own call
+                by_size = {}
+                for image, out_path in zip(images, batch_outputs):
+                    by_size.setdefault(image.size, []).append((image, out_path))
+                
+                for group in by_size.values():
+                    group_images = [image for image, _ in group]
+                    print("Generating normal map (this may take a while)...")
+                    normals = pipe(group_images, batch_size=len(group_images))
+                    
+                    print("Visualizing normals...")
+                    vis = pipe.image_processor.visualize_normals(normals.prediction)
+                    
+                    for vis_image, (_, out_path) in zip(vis, group):
+                        print(f"Saving to {out_path}...")
+                        vis_image.save(out_path)
         
-        print("Visualizing normals...")
-        vis = pipe.image_processor.visualize_normals(normals.prediction)
-        
-        print(f"Saving to {output_path}...")
-        vis[0].save(output_path)
-        
-        print(f"Success! Normal map saved to: {output_path}")
+        if len(output_paths) == 1:
+            print(f"Success! Normal map saved to: {output_paths[0]}")
+        else:
+            print(f"Success! {len(output_paths)} normal maps saved to: {Path(output_paths[0]).parent}")
         
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -75,4 +116,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -9,7 +9,7 @@ import json
 import sys
 from pathlib import Path
 
-from scenedetect import detect, ContentDetector, split_video_ffmpeg
+from scenedetect import ContentDetector, SceneManager, open_video, split_video_ffmpeg
 from scenedetect.video_splitter import VideoMetadata, SceneMetadata
 
 
@@ -25,6 +25,15 @@ def scene_filename_formatter(video=None, scene=None, video_metadata=None, scene_
     return f'scene_{scene_number:03d}.mp4'
 
 
+def _open_detection_video(path):
+    """Open a video for detection, preferring the PyAV backend with threaded decoding."""
+    try:
+        return open_video(path, backend='pyav', threading_mode='AUTO')
+    except Exception:
+        # PyAV not installed (the default backend rejects threading_mode)
+        return open_video(path)
+
+
 def split_video_into_scenes(input_video, output_folder, threshold=27.0, max_len=None, return_timestamps=False):
     """
     Split a video into scenes and save them as numbered MP4 files.
@@ -50,30 +59,18 @@ def split_video_into_scenes(input_video, output_folder, threshold=27.0, max_len=
     
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # If max_len is specified, create a temporary cropped video for detection
-    temp_video = None
-    video_to_detect = input_video
-    if max_len is not None:
-        import tempfile
-        import subprocess
-        temp_video = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
-        temp_video.close()
-        print(f"Cropping video to {max_len} seconds for scene detection...")
-        subprocess.run([
-            'ffmpeg', '-i', str(input_path), '-t', str(max_len),
-            '-c:v', 'libx264', '-c:a', 'copy', '-y', temp_video.name
-        ], check=True, capture_output=True)
-        video_to_detect = temp_video.name
-    
-    print(f"Detecting scenes in: {video_to_detect}")
+    print(f"Detecting scenes in: {input_video}")
     print(f"Output folder: {output_folder}")
     print(f"Threshold: {threshold}")
     
-    scene_list = detect(video_to_detect, ContentDetector(threshold=threshold))
-    
-    # Clean up temp video if created
-    if temp_video is not None:
-        Path(temp_video.name).unlink()
+    # Detection stops at max_len directly, so no cropped copy is needed
+    video = _open_detection_video(str(input_path))
+    scene_manager = SceneManager()
+    # Frames are downscaled (to ~256 px wide) before ContentDetector's HSV pass
+    scene_manager.auto_downscale = True
+    scene_manager.add_detector(ContentDetector(threshold=threshold))
+    scene_manager.detect_scenes(video, end_time=max_len, show_progress=False)
+    scene_list = scene_manager.get_scene_list()
     
     if not scene_list:
         print("No scenes detected in the video.")
@@ -100,9 +97,10 @@ def split_video_into_scenes(input_video, output_folder, threshold=27.0, max_len=
                 '-c:v', 'libx264', '-c:a', 'copy', '-y', str(scene_output)
             ], check=True, capture_output=True)
         else:
+            # Nothing is cut, so the streams are copied unchanged
             subprocess.run([
                 'ffmpeg', '-i', str(input_path),
-                '-c:v', 'libx264', '-c:a', 'copy', '-y', str(scene_output)
+                '-c', 'copy', '-y', str(scene_output)
             ], check=True, capture_output=True)
         
         print(f"Created scene_001.mp4 with entire video (duration: {actual_duration:.2f}s)")
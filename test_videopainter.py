@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """Test script to run VideoPainter on existing dev_cinema output"""
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import torch
 import numpy as np
@@ -20,12 +22,123 @@ from diffusers import (
 )
 from diffusers.utils import export_to_video
 
+try:
+    from torchao.quantization import quantize_, int8_weight_only, float8_weight_only
+except ImportError:  # Optional: weights stay bf16
+    quantize_ = None
+
 # Parameters
 PROMPT = "fill the missing regions realistically"
 NUM_STEPS = 50
 GUIDANCE_SCALE = 6.0
 FPS = 8
 SEED = 42
+PREPROCESS_BATCH_SIZE = 16  # Frames resized per device batch
+PREPROCESS_WORKERS = 8  # DataLoader processes decoding PNGs
+COMPILE_MODELS = torch.cuda.is_available()  # torch.compile + CUDA graphs for the transformer and branch
+WINDOW_FRAMES = 49  # Frames per pipeline call (CogVideoX native length; must be 4k+1)
+WINDOW_OVERLAP = 8  # Frames shared by consecutive windows, cross-faded in the output
+
+
+class FrameDataset(torch.utils.data.Dataset):
+    """Decodes frames and their masks as uint8 tensors; all resizing happens on the device."""
+    
+    def __init__(self, frame_files, masks_dir):
+        self.frame_files = frame_files
+        self.masks_dir = masks_dir
+    
+    def __len__(self):
+        return len(self.frame_files)
+    
+    def __getitem__(self, idx):
+        frame_file = self.frame_files[idx]
+        frame = cv2.imread(str(frame_file))
+        if frame is None:
+            print(f"Warning: Failed to load {frame_file}, skipping", file=sys.stderr)
+            return None
+        
+        # Load corresponding mask
+        mask = None
+        frame_match = re.search(r'frame_(\d+)\.png', frame_file.name)
+        if frame_match:
+            mask_path = self.masks_dir / f"frame_{frame_match.group(1)}.png"
+            if mask_path.exists():
+                mask = cv2.imread(str(mask_path), cv2.IMREAD_GRAYSCALE)
+            else:
+                print(f"Warning: Mask not found for {frame_file.name}, creating empty mask", file=sys.stderr)
+        
+        return torch.from_numpy(frame), (torch.from_numpy(mask) if mask is not None else None)
+
+
+def init_decode_worker(worker_id):
+    """Keep each DataLoader worker's cv2 single-threaded; the workers already decode in parallel."""
+    cv2.setNumThreads(1)
+
+
+def collate_frames(items):
+    """Stack the decoded BGR frames (N, H, W, 3); masks stay a list since some may be missing."""
+    items = [item for item in items if item is not None]
+    if not items:
+        return None, []
+    frames, masks = zip(*items)
+    return torch.stack(frames), list(masks)
+
+
+def expand_frames(frames, target_h, target_w):
+    """
+    Fit a batch of (N, H, W, 3) uint8 BGR frames inside target_h x target_w,
+    keeping the aspect ratio, and center them on black.
+    
+    Returns:
+        (N, target_h, target_w, 3) uint8 RGB numpy array
+    """
+    h, w = frames.shape[1:3]
+    # Calculate scale to fit within target while maintaining aspect ratio
+    scale = min(target_h / h, target_w / w)
+    new_h = int(h * scale)
+    new_w = int(w * scale)
+    
+    # BGR -> RGB and NHWC -> NCHW, then resize the whole batch at once
+    batch = frames.flip(-1).permute(0, 3, 1, 2).float()
+    resized = torch.nn.functional.interpolate(batch, size=(new_h, new_w), mode="bicubic", antialias=True)
+    
+    # Pad to target size (center the resized frame)
+    pad_h = (target_h - new_h) // 2
+    pad_w = (target_w - new_w) // 2
+    expanded = torch.nn.functional.pad(
+        resized, (pad_w, target_w - new_w - pad_w, pad_h, target_h - new_h - pad_h)
+    )
+    return expanded.round_().clamp_(0, 255).to(torch.uint8).permute(0, 2, 3, 1).cpu().numpy()
+
+
+def binarize_masks(masks, target_h, target_w):
+    """Resize a batch of (N, H, W) uint8 masks to target size and binarize to 0/255 (uint8 numpy)."""
+    if masks.shape[1:] != (target_h, target_w):
+        masks = torch.nn.functional.interpolate(
+            masks[:, None].float(), size=(target_h, target_w), mode="bicubic", antialias=True
+        )[:, 0]
+    return (masks > 127).to(torch.uint8).mul_(255).cpu().numpy()
+
+
+def window_starts(num_frames, window, overlap):
+    """Start frame of each overlapping temporal window covering num_frames.
+    
+    Uses the fewest windows that keep at least `overlap` shared frames and
+    spreads them evenly from the first frame to the last, so no window
+    recomputes much more than its neighbours. Every window has the same
+    length (and reuses the same compiled graphs).
+    """
+    if num_frames <= window:
+        return [0]
+    count = -(-(num_frames - overlap) // (window - overlap))  # ceil division
+    return np.rint(np.linspace(0, num_frames - window, count)).astype(int).tolist()
+
+
+def frame_to_image(frame):
+    """Pipeline output frame (float in [0, 1] or uint8) -> RGB PIL image."""
+    if frame.dtype != np.uint8:
+        frame = (np.clip(frame, 0.0, 1.0) * 255).round().astype(np.uint8)
+    return Image.fromarray(frame)
 
 if __name__ == "__main__":
     root_dir = Path("outputs/dev_cinema-1763749773")
@@ -52,6 +165,9 @@ if __name__ == "__main__":
     target_size = filled_first_frame.size[::-1]  # (height, width)
     print(f"Target resolution: {target_size[1]}x{target_size[0]}")
     
+    dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    
     # Load all frames and expand them to match filled frame resolution
     frame_files = sorted(frames_dir.glob("frame_*.png"))
     print(f"\nLoading and expanding {len(frame_files)} frames...")
@@ -59,54 +175,49 @@ if __name__ == "__main__":
     video_frames = []
     masks = []
     
-    for i, frame_file in enumerate(frame_files):
-        frame = cv2.imread(str(frame_file))
-        if frame is None:
-            print(f"Warning: Failed to load {frame_file}, skipping", file=sys.stderr)
+    # DataLoader workers only decode; resize, pad, RGB conversion and mask
+    # binarization run batched on the device
+    loader = torch.utils.data.DataLoader(
+        FrameDataset(frame_files, masks_dir),
+        batch_size=PREPROCESS_BATCH_SIZE,
+        num_workers=PREPROCESS_WORKERS,
+        collate_fn=collate_frames,
+        worker_init_fn=init_decode_worker,
+        pin_memory=torch.cuda.is_available(),
+    )
+    target_h, target_w = target_size
+    num_loaded = 0
+    # Masks are shared PIL images: one all-black mask for every frame without
+    # one, and consecutive identical masks (e.g. a fixed outpainting border)
+    # reuse the previous image instead of converting it again
+    empty_mask = Image.new("RGB", filled_first_frame.size, (0, 0, 0))
+    last_mask_array = None
+    last_mask_image = None
+    for batch_frames, batch_masks in loader:
+        if batch_frames is None:
             continue
         
-        # Resize frame to match filled first frame resolution (maintaining aspect ratio, then padding)
-        h, w = frame.shape[:2]
-        target_h, target_w = target_size
+        expanded = expand_frames(batch_frames.to(device, non_blocking=True), target_h, target_w)
+        video_frames.extend(Image.fromarray(frame, mode="RGB") for frame in expanded)
         
-        # Calculate scale to fit within target while maintaining aspect ratio
-        scale = min(target_h / h, target_w / w)
-        new_h = int(h * scale)
-        new_w = int(w * scale)
-        
-        # Resize frame
-        resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
-        resized_rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-        
-        # Pad to target size (center the resized frame)
-        pad_h = (target_h - new_h) // 2
-        pad_w = (target_w - new_w) // 2
-        
-        expanded = np.zeros((target_h, target_w, 3), dtype=np.uint8)
-        expanded[pad_h:pad_h+new_h, pad_w:pad_w+new_w] = resized_rgb
-        video_frames.append(Image.fromarray(expanded, mode="RGB"))
-        
-        # Load corresponding mask
-        frame_match = re.search(r'frame_(\d+)\.png', frame_file.name)
-        if frame_match:
-            frame_num = frame_match.group(1)
-            mask_path = masks_dir / f"frame_{frame_num}.png"
-            if mask_path.exists():
-                mask = Image.open(mask_path).convert("L")  # Convert to grayscale
-                # Resize mask if needed
-                if mask.size != filled_first_frame.size:
-                    mask = mask.resize(filled_first_frame.size, Image.Resampling.LANCZOS)
-                # Convert to binary mask (0 or 255) and then to RGB
-                mask_array = np.array(mask)
-                mask_array = (mask_array > 127).astype(np.uint8) * 255
-                mask = Image.fromarray(mask_array, mode="L").convert("RGB")
-                masks.append(mask)
-            else:
-                print(f"Warning: Mask not found for {frame_file.name}, creating empty mask", file=sys.stderr)
-                masks.append(Image.new("RGB", filled_first_frame.size, (0, 0, 0)))
+        # Masks are stretched to the filled frame size (no aspect fit)
+        present = [mask for mask in batch_masks if mask is not None]
+        if present:
+            binarized = iter(binarize_masks(torch.stack(present).to(device, non_blocking=True), target_h, target_w))
+        for mask in batch_masks:
+            if mask is None:
+                masks.append(empty_mask)
+                continue
+            mask_array = next(binarized)
+            if last_mask_array is None or not np.array_equal(mask_array, last_mask_array):
+                last_mask_array = mask_array
+                last_mask_image = Image.fromarray(mask_array, mode="L").convert("RGB")
+            masks.append(last_mask_image)
         
-        if (i + 1) % 50 == 0:
-            print(f"  Processed {i + 1}/{len(frame_files)} frames...")
+        previous = num_loaded
+        num_loaded += len(expanded)
+        if num_loaded // 50 > previous // 50:
+            print(f"  Processed {num_loaded}/{len(frame_files)} frames...")
     
     if not video_frames:
         raise RuntimeError("No frames loaded")
@@ -117,8 +228,6 @@ if __name__ == "__main__":
     print(f"\nLoading VideoPainter model from {model_path}...")
     print(f"Loading inpainting branch from {branch_path}...")
     
-    dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
-    device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}, dtype: {dtype}")
     
     branch = CogvideoXBranchModel.from_pretrained(branch_path, torch_dtype=dtype).to(device)
@@ -129,14 +238,31 @@ if __name__ == "__main__":
     )
     pipe.scheduler = CogVideoXDPMScheduler.from_config(pipe.scheduler.config, timestep_spacing="trailing")
     pipe.to(device)
+    # Decode the latents tile by tile so VAE memory doesn't grow with resolution
+    pipe.vae.enable_tiling()
+    
+    if quantize_ is not None and device == "cuda":
+        # Weight-only quantization halves the weight reads that bound the
+        # denoising steps; activations stay bf16. FP8 where the GPU has it
+        # (Ada/Hopper), int8 otherwise
+        use_fp8 = torch.cuda.get_device_capability() >= (8, 9)
+        print(f"Quantizing transformer and branch weights to {'fp8' if use_fp8 else 'int8'}")
+        for model in (pipe.transformer, pipe.branch):
+            quantize_(model, float8_weight_only() if use_fp8 else int8_weight_only())
+    
+    if COMPILE_MODELS:
+        # Fuse the transformer/branch kernels and capture them as CUDA graphs;
+        # the graphs are recorded by a warmup call with the same shapes below
+        torch.backends.cuda.matmul.allow_tf32 = True
+        pipe.transformer = torch.compile(pipe.transformer, mode="reduce-overhead", fullgraph=False)
+        pipe.branch = torch.compile(pipe.branch, mode="reduce-overhead", fullgraph=False)
     
     # Prepare inputs: use filled first frame, masked video frames, and masks
     image = filled_first_frame
     masked_video = video_frames.copy()
     
     # Set first frame mask to all zeros (use first frame as ground truth)
-    first_mask = Image.new("RGB", filled_first_frame.size, (0, 0, 0))
-    masks[0] = first_mask
+    masks[0] = empty_mask
     
     print(f"\nRunning VideoPainter inference...")
     print(f"  Prompt: {PROMPT}")
@@ -144,28 +270,64 @@ if __name__ == "__main__":
     print(f"  Steps: {NUM_STEPS}")
     print(f"  Guidance: {GUIDANCE_SCALE}")
     
-    # Run inference
-    generator = torch.Generator(device=device).manual_seed(SEED)
+    # Long clips run as overlapping windows of the model's native length:
+    # attention cost is quadratic in the temporal tokens, so peak VRAM stays
+    # that of a single window. Each window after the first is conditioned on
+    # the previous window's output at its first frame
+    window = min(len(video_frames), WINDOW_FRAMES)
+    starts = window_starts(len(video_frames), window, WINDOW_OVERLAP)
+    if len(starts) > 1:
+        print(f"  Windows: {len(starts)} x {window} frames")
+    
     # Set first frame mask to all zeros before calling pipeline (this makes it use first frame as GT)
     # The pipeline handles first_frame_gt internally based on mask values
-    inpaint_outputs = pipe(
+    pipe_kwargs = dict(
         prompt=PROMPT,
-        image=image,
         num_videos_per_prompt=1,
-        num_inference_steps=NUM_STEPS,
-        num_frames=len(video_frames),
+        num_frames=window,
         use_dynamic_cfg=True,
         guidance_scale=GUIDANCE_SCALE,
-        generator=generator,
-        video=masked_video,
-        masks=masks,
         strength=1.0,
         replace_gt=False,
         mask_add=True,
-        output_type="np"
     )
     
-    video_generate = inpaint_outputs.frames[0]
+    def window_inputs(start, first_frame):
+        """Pipeline inputs for the window starting at `start`, conditioned on first_frame."""
+        window_video = masked_video[start:start + window]
+        window_masks = masks[start:start + window]
+        if start > 0:
+            window_video[0] = first_frame
+            window_masks[0] = empty_mask
+        return dict(image=first_frame, video=window_video, masks=window_masks)
+    
+    if COMPILE_MODELS:
+        # One denoising step with the real shapes compiles and records the
+        # graphs; the latents are discarded, so skip the VAE decode
+        print("  Warming up compiled models...")
+        pipe(**pipe_kwargs, **window_inputs(0, image), num_inference_steps=1,
+             generator=torch.Generator(device=device).manual_seed(SEED), output_type="latent")
+    
+    # Run inference
+    generator = torch.Generator(device=device).manual_seed(SEED)
+    video_generate = []
+    for start in starts:
+        first_frame = image if start == 0 else frame_to_image(video_generate[start])
+        inpaint_outputs = pipe(**pipe_kwargs, **window_inputs(start, first_frame),
+                               num_inference_steps=NUM_STEPS, generator=generator, output_type="np")
+        window_frames = inpaint_outputs.frames[0]
+        
+        # Cross-fade the frames shared with the previous window, then append the rest
+        overlap = len(video_generate) - start
+        for k in range(overlap):
+            weight = (k + 1) / (overlap + 1)
+            blended = (1 - weight) * video_generate[start + k].astype(np.float32) + weight * window_frames[k]
+            if window_frames.dtype == np.uint8:
+                blended = blended.round()
+            video_generate[start + k] = blended.astype(window_frames.dtype)
+        video_generate.extend(window_frames[overlap:])
+        if len(starts) > 1:
+            print(f"  Infilled frames {start + 1}-{start + window}/{len(video_frames)}")
     
     # Save output video
     output_video_path = output_dir / "infilled_video.mp4"
@@ -177,9 +339,15 @@ if __name__ == "__main__":
     infilled_frames_dir.mkdir(exist_ok=True)
     
     print(f"Saving individual infilled frames to {infilled_frames_dir}...")
-    for i, frame in enumerate(video_generate):
-        frame_img = Image.fromarray(frame)
-        frame_img.save(infilled_frames_dir / f"frame_{i+1:06d}.png")
+    
+    def save_frame(indexed_frame):
+        i, frame = indexed_frame
+        # Intermediate frames: zlib level 1; libpng releases the GIL, so the
+        # thread pool encodes frames in parallel
+        Image.fromarray(frame).save(infilled_frames_dir / f"frame_{i+1:06d}.png", compress_level=1)
+    
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        list(pool.map(save_frame, enumerate(video_generate)))
     
     print(f"\nVideoPainter infilling complete!")
     print(f"  Output video: {output_video_path}")
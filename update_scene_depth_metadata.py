@@ -18,6 +18,10 @@ import json
 import numpy as np
 from pathlib import Path
 import sys
+import zipfile
+
+
+STATS_BLOCK_FRAMES = 16  # Frames read per block when streaming depth stats
 
 
 def get_scene_depth_stats(scene_dir: Path) -> dict:
@@ -38,32 +42,88 @@ def get_scene_depth_stats(scene_dir: Path) -> dict:
         return None
     
     try:
-        data = np.load(npz_path)
-        if 'depth' not in data:
-            return None
-        
-        depth = data['depth']  # Shape: (frames, height, width)
-        
-        # Min and max across entire scene
-        min_depth = float(np.min(depth))
-        max_depth = float(np.max(depth))
-        
-        # 35th percentile from middle frame
-        num_frames = depth.shape[0]
-        middle_frame_idx = num_frames // 2
-        middle_frame = depth[middle_frame_idx]
-        screen_dist = float(np.percentile(middle_frame, 35))
-        
-        return {
-            "min_depth": min_depth,
-            "max_depth": max_depth,
-            "screen_dist": screen_dist
-        }
+        return _stream_depth_stats(npz_path)
     except Exception as e:
         print(f"  Warning: Error reading {npz_path}: {e}")
         return None
 
 
+def _stream_depth_stats(npz_path: Path) -> dict:
+    """
+    Compute the scene stats by reading depth.npy out of the npz a block of
+    frames at a time, so only STATS_BLOCK_FRAMES frames (plus the middle
+    frame) are ever in memory. Works for stored and deflated members alike.
+    """
+    with zipfile.ZipFile(npz_path) as zf:
+        if 'depth.npy' not in zf.namelist():
+            return None
+        
+        with zf.open('depth.npy') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            
+            if fortran_order or dtype.hasobject or len(shape) == 0:
+                # Frames aren't contiguous in the file; load the array whole
+                depth = np.load(npz_path)['depth']
+                frames = (depth[i:i + STATS_BLOCK_FRAMES] for i in range(0, depth.shape[0], STATS_BLOCK_FRAMES))
+            else:
+                frames = _read_frame_blocks(f, shape, dtype)
+            
+            # Shape: (frames, height, width)
+            num_frames = shape[0]
+            middle_frame_idx = num_frames // 2
+            
+            # Min and max across entire scene
+            min_depth = np.inf
+            max_depth = -np.inf
+            middle_frame = None
+            start = 0
+            for block in frames:
+                min_depth = min(min_depth, float(np.min(block)))
+                max_depth = max(max_depth, float(np.max(block)))
+                if start <= middle_frame_idx < start + len(block):
+                    middle_frame = block[middle_frame_idx - start].copy()
+                start += len(block)
+    
+    # 35th percentile from middle frame: O(N) selection of the two order
+    # statistics around the rank (the same linear interpolation as
+    # np.percentile), partitioned in place since the frame is a private copy
+    flat = middle_frame.reshape(-1)
+    rank = 0.35 * (flat.size - 1)
+    lo = int(np.floor(rank))
+    hi = min(lo + 1, flat.size - 1)
+    flat.partition((lo, hi))
+    screen_dist = float(flat[lo]) + (float(flat[hi]) - float(flat[lo])) * (rank - lo)
+    
+    return {
+        "min_depth": min_depth,
+        "max_depth": max_depth,
+        "screen_dist": screen_dist
+    }
+
+
+def _read_frame_blocks(f, shape, dtype):
+    """Yield consecutive (n, *frame_shape) blocks of a C-order array from an open npy stream."""
+    frame_shape = tuple(shape[1:])
+    frame_bytes = int(np.prod(frame_shape, dtype=np.int64)) * dtype.itemsize
+    buffer = bytearray(frame_bytes * STATS_BLOCK_FRAMES)
+    remaining = shape[0]
+    while remaining > 0:
+        n = min(remaining, STATS_BLOCK_FRAMES)
+        view = memoryview(buffer)[:n * frame_bytes]
+        got = 0
+        while got < len(view):
+            read = f.readinto(view[got:])
+            if not read:
+                raise ValueError("depth.npy is truncated")
+            got += read
+        yield np.frombuffer(view, dtype=dtype).reshape((n,) + frame_shape)
+        remaining -= n
+
+
 def update_metadata_with_depth_stats(output_dir: Path):
     """Update metadata.json with scene depth statistics."""
     metadata_file = output_dir / "metadata.json"
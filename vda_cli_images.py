@@ -13,8 +13,11 @@ from pathlib import Path
 import cv2
 import numpy as np
 import torch
+import torchvision
 from tqdm import tqdm
 import shutil
+import subprocess
+import zipfile
 
 # Resolve repository paths so we can import Depth Anything modules from VideoDepthAnything
 REPO_ROOT = Path(__file__).resolve().parents[1]
@@ -25,27 +28,91 @@ if str(VDA_ROOT) not in sys.path:
 
 # Depth Anything
 from depth_anything.dpt import DepthAnything
-from depth_anything.util.transform import Resize, NormalizeImage, PrepareForNet
+try:
+    import tensorrt as trt
+except ImportError:  # Optional: --engine falls back to PyTorch
+    trt = None
+
+# Base model ViT backbone matmuls run on Tensor Cores at this precision
+# (CUDA only); the DPT head stays fp32 so the depth keeps full precision
+BASE_AUTOCAST_DTYPE = torch.bfloat16
+
+# Base model depth is resized back to the image size with this mode, one
+# interpolate call per resolution group ("bilinear" is about half the cost)
+DEPTH_UPSAMPLE_MODE = "bicubic"
+
+# Base model input: lower-bound aspect-preserving resize to 518 in multiples
+# of 14, ImageNet normalization (Depth Anything's Resize/NormalizeImage)
+BASE_INPUT_SIZE = 518
+BASE_MULTIPLE_OF = 14
+BASE_MEAN = (0.485, 0.456, 0.406)
+BASE_STD = (0.229, 0.224, 0.225)
+
+# config.json of LiheYoung/depth_anything_vitl14, and the flattened
+# state_dict cache that lets later runs skip from_pretrained entirely
+BASE_MODEL_CONFIG = {'encoder': 'vitl', 'features': 256, 'out_channels': [256, 512, 1024, 1024]}
+BASE_STATE_CACHE = VDA_ROOT / 'checkpoints/depth_anything_vitl14_state.pth'
+
+NPZ_WRITE_CHUNK_BYTES = 64 * 1024 * 1024  # Copy size when streaming depth into depth.npz
+
+
+def write_depth_npz(out_path: Path, raw_path: Path, shape, dtype, compress: bool = False):
+    """
+    Write a raw C-order depth stack as the 'depth' member of an npz, streaming it in chunks.
+    
+    The result reads back like np.savez(out_path, depth=...) (or
+    savez_compressed with compress) without the stack ever being in memory.
+    """
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': tuple(shape)}
+    with zipfile.ZipFile(out_path, 'w', compression=compression, allowZip64=True) as zf, \
+            zf.open('depth.npy', 'w', force_zip64=True) as member, open(raw_path, 'rb') as raw:
+        np.lib.format.write_array_header_1_0(member, header)
+        shutil.copyfileobj(raw, member, NPZ_WRITE_CHUNK_BYTES)
 
 
 def get_model(model_type: str = 'base', device: str = 'cuda'):
     """Load Depth Anything model (base or metric variants) similar to vda_cli.py."""
     if model_type == 'base':
+        checkpoint_path = str(VDA_ROOT / 'checkpoints/depth_anything_vitl14.pth')
+        use_cache = BASE_STATE_CACHE.exists() and (
+            not os.path.exists(checkpoint_path)
+            or BASE_STATE_CACHE.stat().st_mtime >= os.path.getmtime(checkpoint_path)
+        )
         # DepthAnything internally calls torch.hub.load('torchhub/facebookresearch_dinov2_main', ... , source='local')
         # Ensure CWD is the repo root that contains the 'torchhub' directory so torch.hub can find it.
         _cwd = os.getcwd()
         os.chdir(str(VDA_ROOT))
         try:
+            if use_cache:
+                # Only builds the architecture; weights come from the cache below
+                model = DepthAnything(BASE_MODEL_CONFIG).to(device).eval()
+                try:
+                    # mmap: tensors are paged straight from the file into the parameters
+                    cached = torch.load(BASE_STATE_CACHE, map_location='cpu', mmap=True, weights_only=True)
+                    model.load_state_dict(cached['sd'])
+                    print(f"Loaded cached base model weights: {BASE_STATE_CACHE}")
+                    return model
+                except Exception as e:
+                    print(f"Warning: could not load cached base model weights {BASE_STATE_CACHE} ({e}); loading pretrained")
             model = DepthAnything.from_pretrained('LiheYoung/depth_anything_vitl14', local_files_only=False).to(device).eval()
         finally:
             os.chdir(_cwd)
-        checkpoint_path = str(VDA_ROOT / 'checkpoints/depth_anything_vitl14.pth')
         if os.path.exists(checkpoint_path):
             checkpoint = torch.load(checkpoint_path, map_location=device)
             if 'model' in checkpoint:
                 checkpoint = checkpoint['model']
             model.load_state_dict(checkpoint)
             print(f"Loaded base model checkpoint: {checkpoint_path}")
+        # Written to a temp file and renamed so an interrupted save never leaves a truncated cache
+        tmp_path = BASE_STATE_CACHE.with_suffix('.tmp')
+        try:
+            BASE_STATE_CACHE.parent.mkdir(parents=True, exist_ok=True)
+            torch.save({'sd': model.state_dict(), 'cfg': BASE_MODEL_CONFIG}, tmp_path)
+            os.replace(tmp_path, BASE_STATE_CACHE)
+        except OSError as e:
+            print(f"Warning: could not write base model weight cache {BASE_STATE_CACHE}: {e}")
+            tmp_path.unlink(missing_ok=True)
         return model
 
     if model_type in ['indoor', 'outdoor']:
@@ -67,42 +134,295 @@ def get_model(model_type: str = 'base', device: str = 'cuda'):
     raise ValueError(f"Unknown model type: {model_type}")
 
 
+def autocast_backbone(model):
+    """
+    Run only the base model's ViT backbone under BASE_AUTOCAST_DTYPE autocast.
+    
+    DepthAnything.forward feeds pretrained.get_intermediate_layers into
+    depth_head; the features are cast back to float32 there, so the head's
+    convolutions and upsampling (which set the depth precision) stay fp32.
+    """
+    get_intermediate_layers = model.pretrained.get_intermediate_layers
+    
+    def autocast_intermediate_layers(x, *args, **kwargs):
+        with torch.autocast('cuda', dtype=BASE_AUTOCAST_DTYPE, enabled=x.is_cuda):
+            features = get_intermediate_layers(x, *args, **kwargs)
+        return tuple(tuple(t.float() for t in layer) for layer in features)
+    
+    model.pretrained.get_intermediate_layers = autocast_intermediate_layers
+    return model
+
+
+class TensorRTDepthModel:
+    """
+    Base model run through TensorRT engines, callable like the PyTorch model.
+    
+    The network input size depends on the image aspect ratio, so one engine
+    is built per input resolution, on first use: the model is exported to
+    ONNX and compiled with trtexec (FP16, batch 1..max_batch). Engines are
+    cached as .plan files in cache_dir and reused by later runs.
+    """
+
+    def __init__(self, model, cache_dir: Path, max_batch: int):
+        self.model = model
+        self.cache_dir = Path(cache_dir)
+        self.max_batch = max_batch
+        self.runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
+        self.contexts = {}  # (H, W) -> (engine, execution context)
+
+    def _build_engine(self, engine_path: Path, h: int, w: int):
+        onnx_path = engine_path.with_suffix('.onnx')
+        print(f"Exporting ONNX for {h}x{w} input: {onnx_path}")
+        # Built lazily from inside inference; tracing needs regular tensors and
+        # full-precision ops (trtexec does its own FP16 conversion)
+        with torch.inference_mode(False), torch.no_grad(), torch.autocast('cuda', enabled=False):
+            dummy = torch.randn(1, 3, h, w, device=next(self.model.parameters()).device)
+            torch.onnx.export(
+                self.model, dummy, str(onnx_path), opset_version=17,
+                input_names=['input'], output_names=['depth'],
+                dynamic_axes={'input': {0: 'B'}, 'depth': {0: 'B'}},
+            )
+        print(f"Building TensorRT engine: {engine_path}")
+        subprocess.run([
+            'trtexec', f'--onnx={onnx_path}', '--fp16',
+            f'--minShapes=input:1x3x{h}x{w}',
+            f'--optShapes=input:{self.max_batch}x3x{h}x{w}',
+            f'--maxShapes=input:{self.max_batch}x3x{h}x{w}',
+            f'--saveEngine={engine_path}',
+        ], check=True)
+
+    def _context(self, h: int, w: int):
+        if (h, w) not in self.contexts:
+            engine_path = self.cache_dir / f'depth_anything_vitl14_{h}x{w}_b{self.max_batch}.plan'
+            if not engine_path.exists():
+                self._build_engine(engine_path, h, w)
+            engine = self.runtime.deserialize_cuda_engine(engine_path.read_bytes())
+            self.contexts[(h, w)] = (engine, engine.create_execution_context())
+        return self.contexts[(h, w)][1]
+
+    def __call__(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        image_tensor = image_tensor.float().contiguous()
+        context = self._context(*image_tensor.shape[-2:])
+        context.set_input_shape('input', tuple(image_tensor.shape))
+        depth = torch.empty(tuple(context.get_tensor_shape('depth')), dtype=torch.float32, device=image_tensor.device)
+        context.set_tensor_address('input', image_tensor.data_ptr())
+        context.set_tensor_address('depth', depth.data_ptr())
+        context.execute_async_v3(torch.cuda.current_stream().cuda_stream)
+        return depth
+
+
+def prepare_image(image_bgr: np.ndarray):
+    """
+    Wrap a decoded BGR image for collation; all preprocessing runs on the device.
+    
+    Returns:
+        (uint8 HWC BGR tensor, (h, w) of the image)
+    """
+    return torch.from_numpy(image_bgr), image_bgr.shape[:2]
+
+
+def base_input_size(h: int, w: int):
+    """Network input (height, width) for an HxW image, as Depth Anything's Resize(lower_bound) computes it."""
+    scale = max(BASE_INPUT_SIZE / h, BASE_INPUT_SIZE / w)
+    
+    def constrain(x):
+        y = int(np.round(x / BASE_MULTIPLE_OF) * BASE_MULTIPLE_OF)
+        if y < BASE_INPUT_SIZE:
+            y = int(np.ceil(x / BASE_MULTIPLE_OF) * BASE_MULTIPLE_OF)
+        return y
+    
+    return constrain(scale * h), constrain(scale * w)
+
+
+def preprocess_batch(images: torch.Tensor, model_type: str) -> torch.Tensor:
+    """
+    (B, H, W, 3) uint8 BGR batch on the device -> model input, in one pass of batched ops.
+    
+    Base model: bicubic resize to the network input size, then per-channel
+    normalization, as NCHW float32. Metric model: NCHW RGB in [0, 1].
+    """
+    images = images.flip(-1).permute(0, 3, 1, 2).float()
+    if model_type != 'base':
+        return images / 255.0
+    
+    h, w = images.shape[-2:]
+    images = torch.nn.functional.interpolate(
+        images, size=base_input_size(h, w), mode="bicubic", align_corners=False
+    )
+    mean = torch.tensor(BASE_MEAN, device=images.device).view(1, 3, 1, 1) * 255.0
+    std = torch.tensor(BASE_STD, device=images.device).view(1, 3, 1, 1) * 255.0
+    return (images - mean) / std
+
+
+def collate_images(items):
+    """
+    Stack prepared images into one batch per resolution.
+    
+    Unreadable images (None) are dropped. Images sharing a resolution also
+    share the network input size, so each group becomes a single tensor.
+    Still-encoded JPEGs (size None) stay a list of byte tensors in one group,
+    for decode_jpeg_batches.
+    
+    Returns:
+        (list of (batch tensor, (h, w), positions in the surviving images), number of items)
+    """
+    groups = {}
+    position = 0
+    for item in items:
+        if item is None:
+            continue
+        groups.setdefault(item[1], []).append((position, item[0]))
+        position += 1
+    batches = []
+    for hw, members in groups.items():
+        tensors = [tensor for _, tensor in members]
+        batches.append((torch.stack(tensors) if hw is not None else tensors, hw, [pos for pos, _ in members]))
+    return batches, len(items)
+
+
+def decode_jpeg_batches(batches, device):
+    """
+    Decode the still-encoded JPEG group of collated batches with nvJPEG on the device.
+    
+    The decoded images are regrouped by resolution as uint8 HWC BGR, like
+    the CPU-decoded batches, so the rest of the pipeline is unchanged.
+    """
+    decoded = []
+    for tensors, hw, positions in batches:
+        if hw is not None:
+            decoded.append((tensors, hw, positions))
+            continue
+        # cv2.imread applies EXIF orientation, so the GPU path must too
+        images = torchvision.io.decode_jpeg(
+            tensors, mode=torchvision.io.ImageReadMode.RGB, device=device, apply_exif_orientation=True
+        )
+        groups = {}
+        for pos, image in zip(positions, images):
+            groups.setdefault(tuple(image.shape[-2:]), []).append((pos, image.permute(1, 2, 0).flip(-1)))
+        for image_hw, members in groups.items():
+            decoded.append((torch.stack([image for _, image in members]), image_hw, [pos for pos, _ in members]))
+    return decoded
+
+
+class ImageDataset(torch.utils.data.Dataset):
+    """
+    Decodes images in DataLoader workers so decode overlaps inference.
+    
+    With gpu_jpeg, JPEGs are only read (bytes, size None) and decoded on the
+    device by decode_jpeg_batches.
+    """
+
+    def __init__(self, image_paths, gpu_jpeg: bool = False):
+        self.image_paths = image_paths
+        self.gpu_jpeg = gpu_jpeg
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        img_path = self.image_paths[idx]
+        if self.gpu_jpeg and img_path.suffix.lower() in ('.jpg', '.jpeg'):
+            return torchvision.io.read_file(str(img_path)), None
+        img = cv2.imread(str(img_path))
+        if img is None:
+            print(f"Warning: failed to read {img_path}")
+            return None
+        return prepare_image(img)
+
+
+def init_decode_worker(worker_id):
+    """Keep each DataLoader worker's cv2 single-threaded; the workers already decode in parallel."""
+    cv2.setNumThreads(1)
+
+
 def infer_depth(image_bgr: np.ndarray, model, model_type: str, device: str) -> np.ndarray:
     """Infer depth for a single BGR image, returns float32 HxW array."""
-    image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-    h, w = image_bgr.shape[:2]
+    return infer_depth_batch([image_bgr], model, model_type, device)[0]
+
+
+def infer_depth_batch(images_bgr, model, model_type: str, device: str):
+    """Infer depth for a list of BGR images, returns float32 HxW arrays in input order."""
+    batches, _ = collate_images([prepare_image(image_bgr) for image_bgr in images_bgr])
+    return infer_collated(batches, model, model_type, device)
 
-    if model_type == 'base':
-        from torchvision.transforms import Compose
-        transform = Compose([
-            Resize(
-                width=518,
-                height=518,
-                resize_target=False,
-                keep_aspect_ratio=True,
-                ensure_multiple_of=14,
-                resize_method='lower_bound',
-                image_interpolation_method=cv2.INTER_CUBIC,
-            ),
-            NormalizeImage(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            PrepareForNet(),
-        ])
-        image_tensor = transform({'image': image_rgb / 255.0})['image']
-        image_tensor = torch.from_numpy(image_tensor).unsqueeze(0).to(device)
-        with torch.no_grad():
-            depth = model(image_tensor)
-        depth = torch.nn.functional.interpolate(
-            depth.unsqueeze(1), size=(h, w), mode="bicubic", align_corners=False
-        ).squeeze().cpu().numpy()
-        return depth.astype(np.float32)
-
-    # metric
-    image_tensor = torch.from_numpy(image_rgb).permute(2, 0, 1).unsqueeze(0).float().to(device) / 255.0
-    with torch.no_grad():
-        out = model(image_tensor)
-        # zoedepth returns dict
-        depth = out['metric_depth'].squeeze().cpu().numpy()
-    return depth.astype(np.float32)
+
+def infer_collated(batches, model, model_type: str, device: str):
+    """
+    Run collated batches (see collate_images) with one forward pass per resolution.
+    
+    Returns:
+        List of float32 HxW arrays, in input order
+    """
+    return collect_depths(launch_collated(batches, model, model_type, device))
+
+
+def launch_collated(batches, model, model_type: str, device, streams=None):
+    """
+    Queue inference for collated batches without waiting for the results.
+    
+    Each group is run through the model once and resized back with one
+    interpolate call (none when the network ran at the image size). With streams=(copy_in, copy_out), the upload runs on
+    copy_in and the download into pinned host memory on copy_out, so both
+    overlap the compute queued on the current stream; the caller can then
+    launch the next batch before collecting this one.
+    
+    Returns:
+        Pending results for collect_depths
+    """
+    pending = []
+    for image_tensor, (h, w), positions in batches:
+        if streams is not None:
+            copy_in, copy_out = streams
+            with torch.cuda.stream(copy_in):
+                image_tensor = image_tensor.to(device, non_blocking=True)
+            torch.cuda.current_stream().wait_stream(copy_in)
+            image_tensor.record_stream(torch.cuda.current_stream())
+        else:
+            image_tensor = image_tensor.to(device)
+        image_tensor = preprocess_batch(image_tensor, model_type)
+        
+        if model_type == 'base':
+            with torch.inference_mode():
+                depth = model(image_tensor)
+            if depth.shape[-2:] != (h, w):
+                depth = torch.nn.functional.interpolate(
+                    depth.float().unsqueeze(1), size=(h, w), mode=DEPTH_UPSAMPLE_MODE, align_corners=False
+                )[:, 0]
+            else:
+                # Always a fresh tensor: a compiled model's output lives in a
+                # CUDA graph buffer that the next replay overwrites
+                depth = depth.to(torch.float32, copy=True)
+        else:
+            # metric
+            with torch.inference_mode():
+                out = model(image_tensor)
+                # zoedepth returns dict
+                metric_depth = out['metric_depth']
+                depth = metric_depth.reshape(len(positions), *metric_depth.shape[-2:])
+        
+        if streams is not None:
+            copy_out.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(copy_out):
+                host_depth = torch.empty(depth.shape, dtype=depth.dtype, pin_memory=True)
+                host_depth.copy_(depth, non_blocking=True)
+                depth.record_stream(copy_out)
+                done = torch.cuda.Event()
+                done.record()
+        else:
+            host_depth, done = depth.cpu(), None
+        pending.append((positions, host_depth, done))
+    return pending
+
+
+def collect_depths(pending):
+    """Wait for launched batches (see launch_collated), returns float32 HxW arrays in input order."""
+    depths = [None] * sum(len(positions) for positions, _, _ in pending)
+    for positions, host_depth, done in pending:
+        if done is not None:
+            done.synchronize()
+        for pos, image_depth in zip(positions, host_depth.numpy()):
+            depths[pos] = image_depth.astype(np.float32)
+    return depths
 
 
 def main():
@@ -113,6 +433,17 @@ def main():
     parser.add_argument('--output', '-o', required=True, help='Output directory for results')
     parser.add_argument('--device', default='cuda', help='Device to use (cuda or cpu)')
     parser.add_argument('--visualize', action='store_true', help='Save colored visualization PNGs alongside .npy')
+    parser.add_argument('--batch-size', type=int, default=8, help='Images per forward pass')
+    parser.add_argument('--compress', action='store_true', help='Deflate depth.npz (smaller, much slower to write)')
+    parser.add_argument('--fp16', action='store_true', help='Store depth as float16 (half the size)')
+    parser.add_argument('--gpu-jpeg', action='store_true', help='Decode JPEG inputs on the GPU with nvJPEG')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the model (CUDA graphs; slow first batch)')
+    parser.add_argument('--engine', action='store_true',
+                        help='Run the base model through cached TensorRT FP16 engines (built on first use)')
+    parser.add_argument('--no-autocast', action='store_true',
+                        help='Run the base model backbone in fp32 instead of bf16 autocast (CUDA)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='DataLoader processes decoding images ahead of inference')
     args = parser.parse_args()
 
     input_dir = Path(args.input)
@@ -123,9 +454,29 @@ def main():
     device = torch.device(args.device if torch.cuda.is_available() else 'cpu')
     if device.type == 'cpu' and args.device == 'cuda':
         print("CUDA not available, using CPU")
+    if device.type == 'cuda':
+        # Batches repeat a few fixed shapes, so cuDNN autotuning pays off;
+        # TF32 for the remaining fp32 matmuls/convolutions (Ampere+)
+        torch.backends.cudnn.benchmark = True
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
 
     print(f"Loading model: {args.model}")
     model = get_model(args.model, device)
+    if args.engine:
+        if trt is None:
+            print("Warning: tensorrt not installed, running the PyTorch model")
+        elif args.model != 'base' or device.type != 'cuda':
+            print("Warning: --engine needs the base model on CUDA, running the PyTorch model")
+        else:
+            model = TensorRTDepthModel(model, VDA_ROOT / 'checkpoints', args.batch_size)
+    if args.model == 'base' and device.type == 'cuda' and not args.no_autocast and not isinstance(model, TensorRTDepthModel):
+        # TensorRT engines pick their own precision; autocast is PyTorch only
+        model = autocast_backbone(model)
+    if args.compile and device.type == 'cuda' and not isinstance(model, TensorRTDepthModel):
+        # Fused kernels replayed as CUDA graphs; shapes are static, so each
+        # (batch, resolution) pair compiles once (first batch takes a while)
+        model = torch.compile(model, mode='reduce-overhead', fullgraph=False, dynamic=False)
 
     output_dir = Path(args.output)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -148,26 +499,71 @@ def main():
 
     print(f"Found {len(image_paths)} images in {input_dir}")
 
-    depths = []
-    for img_path in tqdm(image_paths, desc='Processing images'):
-        img = cv2.imread(str(img_path))
-        if img is None:
-            print(f"Warning: failed to read {img_path}")
-            continue
-        depth = infer_depth(img, model, args.model, device)
-        depths.append(depth.astype(np.float32))
+    gpu_jpeg = args.gpu_jpeg and device.type == 'cuda'
+    if args.gpu_jpeg and not gpu_jpeg:
+        print("Warning: --gpu-jpeg needs CUDA, decoding on the CPU")
 
-    if not depths:
-        print("No valid images processed; nothing to save.")
-        sys.exit(1)
+    # Workers decode (or, with --gpu-jpeg, just read) upcoming batches into pinned memory while
+    # the GPU runs the current one
+    loader = torch.utils.data.DataLoader(
+        ImageDataset(image_paths, gpu_jpeg=gpu_jpeg),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        collate_fn=collate_images,
+        pin_memory=device.type == 'cuda',
+        prefetch_factor=4 if args.workers > 0 else None,
+        worker_init_fn=init_decode_worker,
+    )
+
+    # On CUDA each batch is collected only after the next one is launched, so
+    # its download and the next upload overlap compute
+    streams = (torch.cuda.Stream(), torch.cuda.Stream()) if device.type == 'cuda' else None
 
-    # Stack into (N, H, W) and save single NPZ with key 'depth'
-    import numpy as _np
-    depth_stack = _np.stack(depths, axis=0)
+    # Depth is written out batch by batch to a raw file next to the output,
+    # then streamed into depth.npz: memory stays constant in the frame count.
+    # Stored uncompressed by default: single-threaded zlib over float depth
+    # is slow for little gain, and stored members can be memory-mapped
     out_path = output_dir / 'depth.npz'
-    _np.savez_compressed(out_path, depth=depth_stack)
-    print(f"Saved depth stack with shape {depth_stack.shape} to: {out_path}")
+    raw_path = output_dir / 'depth.raw.tmp'
+    out_dtype = np.float16 if args.fp16 else np.float32
+    num_frames = 0
+    frame_shape = None
+
+    def write_depths(raw, depths):
+        nonlocal num_frames, frame_shape
+        for depth in depths:
+            if frame_shape is None:
+                frame_shape = depth.shape
+            elif depth.shape != frame_shape:
+                raise ValueError(f"All images must share a size to stack depth: got {depth.shape}, expected {frame_shape}")
+            depth.astype(out_dtype, copy=False).tofile(raw)
+            num_frames += 1
+
+    pending = None
+    try:
+        with open(raw_path, 'wb') as raw, torch.inference_mode(), \
+                tqdm(total=len(image_paths), desc='Processing images') as progress:
+            for batches, num_items in loader:
+                if gpu_jpeg:
+                    batches = decode_jpeg_batches(batches, device)
+                launched = launch_collated(batches, model, args.model, device, streams)
+                if pending is not None:
+                    write_depths(raw, collect_depths(pending))
+                pending = launched
+                progress.update(num_items)
+            if pending is not None:
+                write_depths(raw, collect_depths(pending))
+
+        if not num_frames:
+            print("No valid images processed; nothing to save.")
+            sys.exit(1)
 
+        # Single NPZ with key 'depth', shape (N, H, W)
+        shape = (num_frames, *frame_shape)
+        write_depth_npz(out_path, raw_path, shape, out_dtype, compress=args.compress)
+    finally:
+        raw_path.unlink(missing_ok=True)
+    print(f"Saved depth stack with shape {shape} to: {out_path}")
 
 if __name__ == '__main__':
     main()
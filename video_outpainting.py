@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 import argparse
+import atexit
 import json
 import os
 import re
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import cv2
@@ -39,6 +43,15 @@ VIDEOPAINTER_BRANCH_PATH = os.getenv("VIDEOPAINTER_BRANCH_PATH", str(VIDEOPAINTE
 VIDEOPAINTER_NUM_STEPS = 50
 VIDEOPAINTER_GUIDANCE_SCALE = 6.0
 VIDEOPAINTER_FPS = 24
+EXPAND_BATCH_SIZE = 16  # Frames resized+padded per device batch for VideoPainter input
+
+
+def _zero_border(buffer: np.ndarray, top: int, left: int, h: int, w: int):
+    """Zero everything in buffer outside the h x w rectangle at (top, left)."""
+    buffer[:top] = 0
+    buffer[top + h:] = 0
+    buffer[top:top + h, :left] = 0
+    buffer[top:top + h, left + w:] = 0
 
 
 def expand_frame_with_alpha(frame: np.ndarray, expand_percent: float) -> Image.Image:
@@ -57,8 +70,10 @@ def expand_frame_with_alpha(frame: np.ndarray, expand_percent: float) -> Image.I
     else:
         rgb_frame = frame
     
-    # Create RGBA image
-    rgba = np.zeros((new_h, new_w, 4), dtype=np.uint8)
+    # Create RGBA image; only the border strips need zeroing, the center is
+    # overwritten below
+    rgba = np.empty((new_h, new_w, 4), dtype=np.uint8)
+    _zero_border(rgba, expand_h, expand_w, h, w)
     
     # Place original frame in center
     rgba[expand_h:expand_h+h, expand_w:expand_w+w, :3] = rgb_frame
@@ -76,11 +91,21 @@ def resize_if_needed(image: Image.Image, max_h: int, max_w: int) -> Image.Image:
     scale = min(max_h / h, max_w / w)
     new_w = int(w * scale)
     new_h = int(h * scale)
-    return image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    # cv2's SIMD, multi-threaded resize; area averaging for the downscale
+    resized = cv2.resize(np.asarray(image), (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return Image.fromarray(resized, mode=image.mode)
 
 
-def expand_frame_to_match(frame: np.ndarray, target_size: tuple) -> Image.Image:
-    """Resize frame to match target size, maintaining aspect ratio and padding if needed."""
+def expand_frame_to_match(frame: np.ndarray, target_size: tuple, out: np.ndarray = None) -> Image.Image:
+    """
+    Resize frame to match target size, maintaining aspect ratio and padding if needed.
+    
+    Args:
+        out: Optional reusable (target_h, target_w, 3) uint8 buffer whose padding
+            is already zero (np.zeros, or a previous call with the same frame
+            size); only the center is written. The returned image is a copy,
+            so the buffer can be reused right away.
+    """
     h, w = frame.shape[:2]
     target_h, target_w = target_size
     
@@ -92,63 +117,81 @@ def expand_frame_to_match(frame: np.ndarray, target_size: tuple) -> Image.Image:
     # Resize frame
     resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LANCZOS4)
     
-    # Convert BGR to RGB if needed
-    if len(resized.shape) == 3 and resized.shape[2] == 3:
-        rgb_frame = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-    else:
-        rgb_frame = resized
-    
     # Pad to target size (center the resized frame)
     pad_h = (target_h - new_h) // 2
     pad_w = (target_w - new_w) // 2
     
-    # Create expanded image
-    expanded = np.zeros((target_h, target_w, 3), dtype=np.uint8)
-    expanded[pad_h:pad_h+new_h, pad_w:pad_w+new_w] = rgb_frame
+    # Create expanded image (zero only the padding)
+    if out is not None:
+        expanded = out
+    else:
+        expanded = np.empty((target_h, target_w, 3), dtype=np.uint8)
+        _zero_border(expanded, pad_h, pad_w, new_h, new_w)
+    center = expanded[pad_h:pad_h+new_h, pad_w:pad_w+new_w]
+    
+    # Convert BGR to RGB if needed, writing straight into the padded image
+    if len(resized.shape) == 3 and resized.shape[2] == 3:
+        cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=center)
+    else:
+        center[:] = resized
     
     return Image.fromarray(expanded, mode="RGB")
 
 
-def infill_video_with_videopainter(
-    root_dir: Path,
-    filled_first_frame_path: Path,
-    model_path: str,
-    branch_path: str,
-    prompt: str = PROMPT,
-    num_inference_steps: int = VIDEOPAINTER_NUM_STEPS,
-    guidance_scale: float = VIDEOPAINTER_GUIDANCE_SCALE,
-    fps: int = VIDEOPAINTER_FPS,
-):
-    """Use VideoPainter to infill remaining video frames."""
-    # Check if running in videopainter environment
-    import subprocess
-    env_check = subprocess.run(
-        ["micromamba", "run", "-n", "videopainter", "python", "-c", "import sys; print(sys.executable)"],
-        capture_output=True,
-        text=True
-    )
-    use_videopainter_env = env_check.returncode == 0
-    if not use_videopainter_env:
-        print(f"Note: videopainter micromamba environment not found (return code: {env_check.returncode})")
-        if env_check.stderr:
-            print(f"Error message: {env_check.stderr}")
-        print("Will attempt to use VideoPainter from current environment...")
+def binarize_mask_images(mask_arrays, size) -> list:
+    """
+    Binarize grayscale masks to 0/255 in one vectorized pass and wrap them as RGB images.
     
-    try:
-        if use_videopainter_env:
-            # Run VideoPainter in the videopainter environment
-            print("Using VideoPainter micromamba environment: videopainter")
-            import subprocess
-            script_content = f'''
-import sys
-sys.path.insert(0, "{VIDEOPAINTER_DIR / "diffusers" / "src"}")
+    Args:
+        mask_arrays: List of (H, W) uint8 masks, all of PIL size `size`; None for an empty mask
+        size: PIL (width, height) of the masks
+    
+    Returns:
+        List of RGB PIL images; consecutive identical masks share one image
+    """
+    present = [mask for mask in mask_arrays if mask is not None]
+    binary = iter((np.stack(present) > 127).view(np.uint8) * np.uint8(255)) if present else iter(())
+    empty_mask = Image.new("RGB", size, (0, 0, 0))
+    
+    images = []
+    last_array = last_image = None
+    for mask in mask_arrays:
+        if mask is None:
+            images.append(empty_mask)
+            continue
+        mask_array = next(binary)
+        if last_array is None or not np.array_equal(mask_array, last_array):
+            last_array = mask_array
+            last_image = Image.fromarray(mask_array, mode="L").convert("RGB")
+        images.append(last_image)
+    return images
+
 
+# Body of the persistent VideoPainter process run in the videopainter
+# environment: loads the pipeline once, then serves infill requests
+VIDEOPAINTER_WORKER_SCRIPT = r'''
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+
+# Requests arrive as JSON lines on stdin and responses go to a private copy
+# of the original stdout. fd 1 itself is pointed at stderr so prints and
+# native library output (CUDA, tqdm from C extensions) cannot interleave
+# with the protocol
+protocol_out = os.fdopen(os.dup(1), "w")
+os.dup2(2, 1)
+sys.stdout = sys.stderr
+
+diffusers_src, model_path, branch_path = sys.argv[1:4]
+sys.path.insert(0, diffusers_src)
+
 import torch
 import numpy as np
 from PIL import Image
 import cv2
-import re
 
 from diffusers import (
     CogVideoXDPMScheduler,
@@ -157,130 +200,323 @@ from diffusers import (
 )
 from diffusers.utils import export_to_video
 
-# Your infill_video_with_videopainter code here
-root_dir = Path("{root_dir}")
-frames_dir = root_dir / "frames"
-masks_dir = root_dir / "masks"
-infilled_dir = root_dir / "infilled"
-output_dir = root_dir / "output"
-output_dir.mkdir(exist_ok=True)
-
-filled_first_frame = Image.open("{filled_first_frame_path}").convert("RGB")
-target_size = filled_first_frame.size[::-1]
-
-frame_files = sorted(frames_dir.glob("frame_*.png"))
-print(f"Loading {{len(frame_files)}} frames...")
-
-video_frames = []
-masks = []
-
-for i, frame_file in enumerate(frame_files):
-    frame = cv2.imread(str(frame_file))
-    if frame is None:
-        continue
-    
-    h, w = frame.shape[:2]
-    target_h, target_w = target_size
-    pad_h = (target_h - h) // 2
-    pad_w = (target_w - w) // 2
-    
-    expanded = np.zeros((target_h, target_w, 3), dtype=np.uint8)
-    expanded[pad_h:pad_h+h, pad_w:pad_w+w] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    video_frames.append(Image.fromarray(expanded, mode="RGB"))
-    
-    frame_match = re.search(r'frame_(\\d+)\\.png', frame_file.name)
-    if frame_match:
-        frame_num = frame_match.group(1)
-        mask_path = masks_dir / f"frame_{{frame_num}}.png"
-        if mask_path.exists():
-            mask = Image.open(mask_path).convert("L")
-            if mask.size != filled_first_frame.size:
-                mask = mask.resize(filled_first_frame.size, Image.Resampling.LANCZOS)
-            mask_array = np.array(mask)
-            mask_array = (mask_array > 127).astype(np.uint8) * 255
-            mask = Image.fromarray(mask_array, mode="L").convert("RGB")
-            masks.append(mask)
-        else:
-            masks.append(Image.new("RGB", filled_first_frame.size, (0, 0, 0)))
-
-if not video_frames:
-    raise RuntimeError("No frames loaded")
-
-print(f"Loaded {{len(video_frames)}} frames and {{len(masks)}} masks")
-
 dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
 print(f"Loading VideoPainter model from {model_path}...")
-branch = CogvideoXBranchModel.from_pretrained("{branch_path}", torch_dtype=dtype).to(device)
+branch = CogvideoXBranchModel.from_pretrained(branch_path, torch_dtype=dtype).to(device)
 pipe = CogVideoXI2VDualInpaintAnyLPipeline.from_pretrained(
-    "{model_path}",
+    model_path,
     branch=branch,
     torch_dtype=dtype,
 )
 pipe.scheduler = CogVideoXDPMScheduler.from_config(pipe.scheduler.config, timestep_spacing="trailing")
 pipe.to(device)
 
-image = filled_first_frame
-masked_video = video_frames.copy()
-masks[0] = Image.new("RGB", filled_first_frame.size, (0, 0, 0))
-
-print(f"Running VideoPainter inference...")
-generator = torch.Generator(device=device).manual_seed({SEED})
-inpaint_outputs = pipe(
-    prompt="{prompt}",
-    image=image,
-    num_videos_per_prompt=1,
-    num_inference_steps={num_inference_steps},
-    num_frames=len(video_frames),
-    use_dynamic_cfg=True,
-    guidance_scale={guidance_scale},
-    generator=generator,
-    video=masked_video,
-    masks=masks,
-    strength=1.0,
-    replace_gt=False,
-    mask_add=True,
-    first_frame_gt=True,
-    output_type="np"
-)
 
-video_generate = inpaint_outputs.frames[0]
+def infill(root_dir, filled_first_frame_path, prompt, num_inference_steps, guidance_scale, fps, seed, mask_path=None):
+    root_dir = Path(root_dir)
+    frames_dir = root_dir / "frames"
+    masks_dir = root_dir / "masks"
+    output_dir = root_dir / "output"
+    output_dir.mkdir(exist_ok=True)
+    
+    filled_first_frame = Image.open(filled_first_frame_path).convert("RGB")
+    target_size = filled_first_frame.size[::-1]
+    
+    frame_files = sorted(frames_dir.glob("frame_*.png"))
+    print(f"Loading {len(frame_files)} frames...")
+    
+    def load_mask(path):
+        mask = np.asarray(Image.open(path).convert("L"))
+        if mask.shape != target_size:
+            # Nearest is enough for a mask that is binarized right after
+            mask = cv2.resize(mask, filled_first_frame.size, interpolation=cv2.INTER_NEAREST)
+        return mask
+    
+    def load_frame_and_mask(frame_file):
+        frame = cv2.imread(str(frame_file))
+        if frame is None:
+            return None
+        
+        h, w = frame.shape[:2]
+        target_h, target_w = target_size
+        pad_h = (target_h - h) // 2
+        pad_w = (target_w - w) // 2
+        
+        expanded = np.zeros((target_h, target_w, 3), dtype=np.uint8)
+        expanded[pad_h:pad_h+h, pad_w:pad_w+w] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        expanded_frame = Image.fromarray(expanded, mode="RGB")
+        
+        # A shared mask (mask_path) is loaded once below instead of per frame
+        frame_match = re.search(r'frame_(\d+)\.png', frame_file.name)
+        if mask_path is not None or not frame_match:
+            return expanded_frame, False, None
+        frame_num = frame_match.group(1)
+        frame_mask_path = masks_dir / f"frame_{frame_num}.png"
+        if not frame_mask_path.exists():
+            return expanded_frame, True, None
+        return expanded_frame, True, load_mask(frame_mask_path)
+    
+    def binarize(mask_arrays):
+        # Binarize all masks in one pass; consecutive identical masks share an image
+        present = [mask for mask in mask_arrays if mask is not None]
+        binary = iter((np.stack(present) > 127).view(np.uint8) * np.uint8(255)) if present else iter(())
+        empty_mask = Image.new("RGB", filled_first_frame.size, (0, 0, 0))
+        images = []
+        last_array = last_image = None
+        for mask in mask_arrays:
+            if mask is None:
+                images.append(empty_mask)
+                continue
+            mask_array = next(binary)
+            if last_array is None or not np.array_equal(mask_array, last_array):
+                last_array = mask_array
+                last_image = Image.fromarray(mask_array, mode="L").convert("RGB")
+            images.append(last_image)
+        return images
+    
+    video_frames = []
+    mask_arrays = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for loaded in pool.map(load_frame_and_mask, frame_files):
+            if loaded is not None:
+                expanded_frame, has_mask, mask_array = loaded
+                video_frames.append(expanded_frame)
+                if has_mask:
+                    mask_arrays.append(mask_array)
+    
+    if mask_path is not None:
+        masks = binarize([load_mask(mask_path)]) * len(video_frames)
+    else:
+        masks = binarize(mask_arrays)
+    
+    if not video_frames:
+        raise RuntimeError("No frames loaded")
+    
+    print(f"Loaded {len(video_frames)} frames and {len(masks)} masks")
+    
+    image = filled_first_frame
+    masked_video = video_frames.copy()
+    masks[0] = Image.new("RGB", filled_first_frame.size, (0, 0, 0))
+    
+    print(f"Running VideoPainter inference...")
+    generator = torch.Generator(device=device).manual_seed(seed)
+    inpaint_outputs = pipe(
+        prompt=prompt,
+        image=image,
+        num_videos_per_prompt=1,
+        num_inference_steps=num_inference_steps,
+        num_frames=len(video_frames),
+        use_dynamic_cfg=True,
+        guidance_scale=guidance_scale,
+        generator=generator,
+        video=masked_video,
+        masks=masks,
+        strength=1.0,
+        replace_gt=False,
+        mask_add=True,
+        first_frame_gt=True,
+        output_type="np"
+    )
+    
+    video_generate = inpaint_outputs.frames[0]
+    
+    output_video_path = output_dir / "infilled_video.mp4"
+    print(f"Saving infilled video to {output_video_path}...")
+    export_to_video(video_generate, str(output_video_path), fps=fps)
+    
+    infilled_frames_dir = root_dir / "infilled_frames"
+    infilled_frames_dir.mkdir(exist_ok=True)
+    
+    print(f"Saving individual infilled frames...")
+    for i, frame in enumerate(video_generate):
+        frame_img = Image.fromarray(frame)
+        frame_img.save(infilled_frames_dir / f"frame_{i+1:06d}.png")
+    
+    print(f"VideoPainter infilling complete!")
 
-output_video_path = output_dir / "infilled_video.mp4"
-print(f"Saving infilled video to {{output_video_path}}...")
-export_to_video(video_generate, str(output_video_path), fps={fps})
 
-infilled_frames_dir = root_dir / "infilled_frames"
-infilled_frames_dir.mkdir(exist_ok=True)
+for line in sys.stdin:
+    try:
+        infill(**json.loads(line))
+        response = {"status": "ok"}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        response = {"status": "error", "error": str(e)}
+    protocol_out.write(json.dumps(response) + "\n")
+    protocol_out.flush()
+'''
 
-print(f"Saving individual infilled frames...")
-for i, frame in enumerate(video_generate):
-    frame_img = Image.fromarray(frame)
-    frame_img.save(infilled_frames_dir / f"frame_{{i+1:06d}}.png")
 
-print(f"VideoPainter infilling complete!")
-'''
-            # Write temporary script
-            temp_script = root_dir / "_videopainter_infill.py"
-            with open(temp_script, "w") as f:
-                f.write(script_content)
-            
-            # Run in videopainter environment
-            result = subprocess.run(
-                ["micromamba", "run", "-n", "videopainter", "python", str(temp_script)],
-                cwd=str(SCRIPT_DIR),
-                capture_output=False,
+class VideoPainterWorker:
+    """
+    VideoPainter pipeline kept loaded in a persistent videopainter-environment process.
+    
+    The child builds the branch and pipeline once, then serves one infill
+    request per video over its stdin/stdout, so CogVideoX weights are read
+    and moved to the GPU once per session instead of once per video.
+    
+    The worker only stays up between consecutive VideoPainter calls:
+    process_video_outpainting closes it (close_videopainter_workers) before
+    each FLUX Fill subprocess, so CogVideoX and FLUX are never resident on
+    the GPU together. A per-video pipeline (fill, then infill) therefore
+    reloads CogVideoX for every video; only repeated
+    infill_video_with_videopainter calls reuse it.
+    """
+    
+    def __init__(self, model_path: str, branch_path: str):
+        fd, script_path = tempfile.mkstemp(prefix="_videopainter_worker_", suffix=".py")
+        with os.fdopen(fd, "w") as f:
+            f.write(VIDEOPAINTER_WORKER_SCRIPT)
+        self.script_path = Path(script_path)
+        self.process = subprocess.Popen(
+            ["micromamba", "run", "-n", "videopainter", "python", str(self.script_path),
+             str(VIDEOPAINTER_DIR / "diffusers" / "src"), model_path, branch_path],
+            cwd=str(SCRIPT_DIR),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        atexit.register(self.close)
+    
+    def alive(self) -> bool:
+        return self.process.poll() is None
+    
+    def infill(self, **request):
+        """Run one infill request (see VIDEOPAINTER_WORKER_SCRIPT's infill) and wait for it."""
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"VideoPainter inference failed with return code {self.process.wait()}")
+            try:
+                response = json.loads(line)
+                break
+            except json.JSONDecodeError:
+                # Stray output that reached the protocol pipe; pass it on and keep waiting
+                print(f"VideoPainter worker (non-protocol output): {line.rstrip()}", file=sys.stderr)
+        if response["status"] != "ok":
+            raise RuntimeError(f"VideoPainter inference failed: {response.get('error')}")
+    
+    def close(self):
+        if self.alive():
+            self.process.stdin.close()
+            self.process.wait()
+        self.script_path.unlink(missing_ok=True)
+
+
+# Whether the videopainter micromamba environment exists (checked once), and
+# the live workers keyed by (model path, branch path)
+_VIDEOPAINTER_ENV = None
+_VIDEOPAINTER_WORKERS = {}
+
+
+def get_videopainter_worker(model_path: str, branch_path: str):
+    """
+    Get the persistent VideoPainter worker for these weights, starting it if needed.
+    
+    Returns:
+        A VideoPainterWorker, or None if the videopainter environment is missing
+    """
+    global _VIDEOPAINTER_ENV
+    if _VIDEOPAINTER_ENV is None:
+        env_check = subprocess.run(
+            ["micromamba", "run", "-n", "videopainter", "python", "-c", "import sys; print(sys.executable)"],
+            capture_output=True,
+            text=True
+        )
+        _VIDEOPAINTER_ENV = env_check.returncode == 0
+        if not _VIDEOPAINTER_ENV:
+            print(f"Note: videopainter micromamba environment not found (return code: {env_check.returncode})")
+            if env_check.stderr:
+                print(f"Error message: {env_check.stderr}")
+            print("Will attempt to use VideoPainter from current environment...")
+    if not _VIDEOPAINTER_ENV:
+        return None
+    
+    key = (model_path, branch_path)
+    worker = _VIDEOPAINTER_WORKERS.get(key)
+    if worker is None or not worker.alive():
+        worker = _VIDEOPAINTER_WORKERS[key] = VideoPainterWorker(model_path, branch_path)
+    return worker
+
+
+def close_videopainter_workers():
+    """Stop every persistent VideoPainter worker, releasing its GPU memory."""
+    for worker in _VIDEOPAINTER_WORKERS.values():
+        worker.close()
+    _VIDEOPAINTER_WORKERS.clear()
+
+
+def expand_frames_to_match(frames: torch.Tensor, target_size: tuple) -> np.ndarray:
+    """
+    Batched expand_frame_to_match on the frames' device.
+    
+    Fits a (N, H, W, 3) uint8 BGR batch inside target_size (height, width),
+    keeping the aspect ratio, centered on black: one resize and one pad
+    for the whole batch.
+    
+    Returns:
+        (N, target_h, target_w, 3) uint8 RGB numpy array
+    """
+    h, w = frames.shape[1:3]
+    target_h, target_w = target_size
+    
+    # Calculate scale to fit within target while maintaining aspect ratio
+    scale = min(target_h / h, target_w / w)
+    new_h = int(h * scale)
+    new_w = int(w * scale)
+    
+    # BGR -> RGB and NHWC -> NCHW, then resize the whole batch at once
+    batch = frames.flip(-1).permute(0, 3, 1, 2).float()
+    resized = torch.nn.functional.interpolate(batch, size=(new_h, new_w), mode="bicubic", antialias=True)
+    
+    # Pad to target size (center the resized frame)
+    pad_h = (target_h - new_h) // 2
+    pad_w = (target_w - new_w) // 2
+    expanded = torch.nn.functional.pad(
+        resized, (pad_w, target_w - new_w - pad_w, pad_h, target_h - new_h - pad_h)
+    )
+    return expanded.round_().clamp_(0, 255).to(torch.uint8).permute(0, 2, 3, 1).cpu().numpy()
+
+
+def infill_video_with_videopainter(
+    root_dir: Path,
+    filled_first_frame_path: Path,
+    model_path: str,
+    branch_path: str,
+    prompt: str = PROMPT,
+    num_inference_steps: int = VIDEOPAINTER_NUM_STEPS,
+    guidance_scale: float = VIDEOPAINTER_GUIDANCE_SCALE,
+    fps: int = VIDEOPAINTER_FPS,
+    mask_path: Path = None,
+):
+    """
+    Use VideoPainter to infill remaining video frames.
+    
+    With mask_path, that one mask is used for every frame (decoded once);
+    otherwise each frame's mask is read from masks/.
+    """
+    worker = get_videopainter_worker(model_path, branch_path)
+    
+    try:
+        if worker is not None:
+            # Run VideoPainter in the videopainter environment
+            print("Using VideoPainter micromamba environment: videopainter")
+            worker.infill(
+                root_dir=str(root_dir),
+                filled_first_frame_path=str(filled_first_frame_path),
+                prompt=prompt,
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                fps=fps,
+                seed=SEED,
+                mask_path=str(mask_path) if mask_path is not None else None,
             )
-            
-            # Clean up
-            if temp_script.exists():
-                temp_script.unlink()
-            
-            if result.returncode != 0:
-                raise RuntimeError(f"VideoPainter inference failed with return code {result.returncode}")
-            
-            return output_dir / "infilled_video.mp4"
+            return Path(root_dir) / "output" / "infilled_video.mp4"
         else:
             # Fallback to direct import (if running in correct environment)
             from diffusers import (
@@ -307,44 +543,88 @@ print(f"VideoPainter infilling complete!")
     target_size = filled_first_frame.size[::-1]  # (height, width)
     print(f"Target resolution: {target_size[1]}x{target_size[0]}")
     
+    dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    
     # Load all frames and expand them to match filled frame resolution
     frame_files = sorted(frames_dir.glob("frame_*.png"))
     print(f"\nLoading and expanding {len(frame_files)} frames...")
     
-    video_frames = []
-    masks = []
-    
-    for i, frame_file in enumerate(frame_files):
+    def load_mask(path):
+        mask = np.asarray(Image.open(path).convert("L"))  # Convert to grayscale
+        # Resize mask if needed; nearest is enough for a mask that is
+        # binarized right after
+        if mask.shape != target_size:
+            mask = cv2.resize(mask, filled_first_frame.size, interpolation=cv2.INTER_NEAREST)
+        return mask
+    
+    # On CUDA, frames are expanded in batches on the GPU below; otherwise
+    # each frame is expanded on the CPU as it is decoded, into a padded buffer
+    # allocated once per decode thread
+    expand_on_device = device == "cuda"
+    expand_buffers = threading.local()
+    
+    def load_frame_and_mask(frame_file):
+        """Decode (and on CPU, expand) one frame and its grayscale mask; None if the frame is unreadable."""
         frame = cv2.imread(str(frame_file))
         if frame is None:
             print(f"Warning: Failed to load {frame_file}, skipping", file=sys.stderr)
-            continue
+            return None
         
         # Expand frame to match filled first frame resolution
-        expanded_frame = expand_frame_to_match(frame, target_size)
-        video_frames.append(expanded_frame)
+        if expand_on_device:
+            expanded_frame = frame
+        else:
+            if getattr(expand_buffers, "shape", None) != frame.shape:
+                expand_buffers.shape = frame.shape
+                expand_buffers.out = np.zeros((*target_size, 3), dtype=np.uint8)
+            expanded_frame = expand_frame_to_match(frame, target_size, out=expand_buffers.out)
         
-        # Load corresponding mask
+        # Load corresponding mask: (has a mask entry, grayscale mask or None for empty)
         frame_match = re.search(r'frame_(\d+)\.png', frame_file.name)
-        if frame_match:
-            frame_num = frame_match.group(1)
-            mask_path = masks_dir / f"frame_{frame_num}.png"
-            if mask_path.exists():
-                mask = Image.open(mask_path).convert("L")  # Convert to grayscale
-                # Resize mask if needed
-                if mask.size != filled_first_frame.size:
-                    mask = mask.resize(filled_first_frame.size, Image.Resampling.LANCZOS)
-                # Convert to binary mask (0 or 255) and then to RGB
-                mask_array = np.array(mask)
-                mask_array = (mask_array > 127).astype(np.uint8) * 255
-                mask = Image.fromarray(mask_array, mode="L").convert("RGB")
-                masks.append(mask)
-            else:
-                print(f"Warning: Mask not found for {frame_file.name}, creating empty mask", file=sys.stderr)
-                masks.append(Image.new("RGB", filled_first_frame.size, (0, 0, 0)))
-        
-        if (i + 1) % 50 == 0:
-            print(f"  Processed {i + 1}/{len(frame_files)} frames...")
+        if mask_path is not None or not frame_match:
+            return expanded_frame, False, None
+        frame_num = frame_match.group(1)
+        frame_mask_path = masks_dir / f"frame_{frame_num}.png"
+        if not frame_mask_path.exists():
+            print(f"Warning: Mask not found for {frame_file.name}, creating empty mask", file=sys.stderr)
+            return expanded_frame, True, None
+        return expanded_frame, True, load_mask(frame_mask_path)
+    
+    video_frames = []
+    mask_arrays = []
+    pending_frames = []  # Decoded BGR frames waiting for a device batch
+    
+    def expand_pending():
+        batch = torch.from_numpy(np.stack(pending_frames)).to(device)
+        video_frames.extend(Image.fromarray(frame, mode="RGB") for frame in expand_frames_to_match(batch, target_size))
+        pending_frames.clear()
+    
+    # cv2 and PIL release the GIL while decoding, so threads decode in parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for i, loaded in enumerate(pool.map(load_frame_and_mask, frame_files)):
+            if loaded is not None:
+                expanded_frame, has_mask, mask_array = loaded
+                if expand_on_device:
+                    pending_frames.append(expanded_frame)
+                    if len(pending_frames) == EXPAND_BATCH_SIZE:
+                        expand_pending()
+                else:
+                    video_frames.append(expanded_frame)
+                if has_mask:
+                    mask_arrays.append(mask_array)
+            
+            if (i + 1) % 50 == 0:
+                print(f"  Processed {i + 1}/{len(frame_files)} frames...")
+    if pending_frames:
+        expand_pending()
+    
+    # Convert to binary masks (0 or 255) and then to RGB; a shared mask is
+    # processed once and referenced by every frame
+    if mask_path is not None:
+        masks = binarize_mask_images([load_mask(mask_path)], filled_first_frame.size) * len(video_frames)
+    else:
+        masks = binarize_mask_images(mask_arrays, filled_first_frame.size)
     
     if not video_frames:
         raise RuntimeError("No frames loaded")
@@ -355,9 +635,6 @@ print(f"VideoPainter infilling complete!")
     print(f"\nLoading VideoPainter model from {model_path}...")
     print(f"Loading inpainting branch from {branch_path}...")
     
-    dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    
     branch = CogvideoXBranchModel.from_pretrained(branch_path, torch_dtype=dtype).to(device)
     pipe = CogVideoXI2VDualInpaintAnyLPipeline.from_pretrained(
         model_path,
@@ -506,6 +783,9 @@ def process_video_outpainting(
         "--mask-output", str(mask_path),
     ]
     
+    # FLUX needs the GPU to itself; a VideoPainter worker left from an
+    # earlier video would keep CogVideoX resident next to it
+    close_videopainter_workers()
     result = subprocess.run(cmd, capture_output=True, text=True)
     if result.returncode != 0:
         print(f"Error running flux_fill: {result.stderr}", file=sys.stderr)
@@ -514,7 +794,9 @@ def process_video_outpainting(
     print(f"Saved filled frame to {filled_output_path}")
     print(f"Saved mask to {mask_path}")
     
-    # Duplicate mask for all frames (same mask applies to all frames)
+    # Duplicate mask for all frames (same mask applies to all frames). Hard
+    # links keep per-frame mask files for other tools without writing the
+    # data again; VideoPainter below is handed the single mask directly
     print(f"\nDuplicating mask for all {len(frame_files)} frames...")
     for frame_file in frame_files:
         frame_match = re.search(r'frame_(\d+)\.png', frame_file.name)
@@ -524,10 +806,13 @@ def process_video_outpainting(
         
         frame_num = frame_match.group(1)
         
-        # Copy mask
+        # Link mask (copy where the filesystem has no hard links)
         frame_mask_path = masks_dir / f"frame_{frame_num}.png"
         if not frame_mask_path.exists():
-            shutil.copy2(mask_path, frame_mask_path)
+            try:
+                os.link(mask_path, frame_mask_path)
+            except OSError:
+                shutil.copy2(mask_path, frame_mask_path)
     
     print(f"Duplicated masks for all frames")
     
@@ -551,6 +836,7 @@ def process_video_outpainting(
                 num_inference_steps=VIDEOPAINTER_NUM_STEPS,
                 guidance_scale=VIDEOPAINTER_GUIDANCE_SCALE,
                 fps=extraction_fps,
+                mask_path=mask_path,
             )
         except Exception as e:
             print(f"\n{'='*60}", file=sys.stderr)